@@ -1,8 +1,9 @@
 # import simpy
 # import random
 import numpy as np
-import pandas as pd
-import math
+from Queue import mean_service_time, service_time_moments, customer_times, NO_SERVER
+from helpers import utilization
+import erlang
 
 class QueueMetrics:
     
@@ -19,6 +20,8 @@ class QueueMetrics:
         Parameters
         ----------
         queue_object : `class` QueueSimulation
+            For the expected metrics only, any object with its parameters
+            (see `main.run_parameters`).
         '''
 
         self.simulation = queue_object
@@ -28,8 +31,9 @@ class QueueMetrics:
     
         self.rho = self.arrival_rate/(self.c * self.service_rate)
 
-        # utilization must be less than one for an exponentially distributed system
-        assert self.rho < 1
+        # utilization (on the actual mean service time) must be less than one
+        self.utilization = utilization(queue_object.B, self.arrival_rate, self.service_rate, self.c)
+        assert self.utilization < 1
 
 
     def calc_p0(self):
@@ -40,17 +44,7 @@ class QueueMetrics:
         I.e., customer visits an empty system.
         '''
 
-        if self.c == 1:
-            return 1 - self.rho
-        else:
-            s = 0
-            for k in range(self.c):
-                # summation
-                s += (self.c * self.rho)**k / math.factorial(k)
-            # add last component
-            s += (self.c * self.rho)**self.c / (math.factorial(self.c) * (1 - self.rho))
-            p_0 = s**(-1)
-            return p_0
+        return erlang.empty_probability(self.c, self.arrival_rate / self.service_rate)
 
 
     def calc_delay_prob(self ,p_0):
@@ -61,16 +55,11 @@ class QueueMetrics:
 
         Parameters
         ----------
-        p_0 : `float` probability that the system is empty
+        p_0 : `float` probability that the system is empty (not needed for Erlang-C)
         '''
 
-        # probability customer will have to wait for service
-        if self.c == 1:
-            return self.rho
-        else:
-            p_c = p_0 * ((self.c * self.rho)**self.c / math.factorial(self.c))
-            p_d = p_c / (1 - self.rho)
-            return p_d
+        # probability customer will have to wait for service (Erlang-C, stable for large c)
+        return erlang.erlang_c(self.c, self.arrival_rate / self.service_rate)
 
 
     def calc_exp_length(self, delay_prob):
@@ -105,20 +94,24 @@ class QueueMetrics:
         """
         Description
         -----------
-        Returns a dict with expected performance measures.
+        Returns a dict with expected performance measures (memoized per system).
+        Exact for M/M/c. For 'D' and 'H' service, uses the actual service time
+        moments in Pollaczek-Khinchine (c = 1) or Allen-Cunneen (c > 1).
         """
+        if self.simulation.B == "M":
+            return erlang.mmc_metrics(self.arrival_rate, self.service_rate, self.c)
+        mean, scv = service_time_moments(self.simulation.B, self.service_rate)
+        return erlang.mgc_metrics(self.arrival_rate, mean, scv, self.c)
 
-        p_0 = self.calc_p0()
-        delay_prob = self.calc_delay_prob(p_0)
-
-        metrics = {
-            'p_0': p_0,
-            'delay probability': delay_prob,
-            'expected queue length': self.calc_exp_length(delay_prob),
-            'expected waiting time': self.calc_exp_wait(delay_prob)
-        }
 
-        return metrics
+    def get_control_expectations(self):
+        """
+        Description
+        -----------
+        Returns the expectations of the control variates of `QueueSimulation.get_controls`
+        (the mean service time).
+        """
+        return (mean_service_time(self.simulation.B, self.service_rate),)
 
 
     def get_measured_metrics(self):
@@ -127,6 +120,14 @@ class QueueMetrics:
         -----------
         Returns dict with value: (mean performance metric, variance)
         """
+        if self.simulation.stream:
+            waiting_times = self.simulation.stream.waiting_times
+            queue_lengths = self.simulation.stream.queue_lengths
+            return {
+                "Average waiting time": (waiting_times.mean, waiting_times.var),
+                "Average queue length": (queue_lengths.mean, queue_lengths.var),
+            }
+
         waiting_times = self.simulation.waiting_times
         queue_lengths = self.simulation.queue_lengths
         metrics = {
@@ -136,14 +137,191 @@ class QueueMetrics:
 
         return metrics 
 
+    def get_time_averages(self):
+        """
+        Description
+        -----------
+        Returns dict with time-average number of customers in system and in queue
+        (the simulated L and L_q), as opposed to queue lengths seen at arrivals.
+        """
+        in_system, in_queue = self.simulation.get_time_averages()
+        return {
+            "Time-average number in system": in_system,
+            "Time-average number in queue": in_queue,
+        }
+
+    def get_batch_means_metrics(self, n_batches=20, confidence=0.95):
+        """
+        Description
+        -----------
+        Returns dict with value: (mean performance metric, CI half-width, observations
+        dropped as warm-up), from the batch means of a single long streaming run.
+        """
+        stream = self.simulation.stream
+        return {
+            "Average waiting time": stream.waiting_time_batches.confidence_interval(n_batches, confidence),
+            "Average queue length": stream.queue_length_batches.confidence_interval(n_batches, confidence),
+        }
+
+    def get_customer_metrics(self):
+        """
+        Description
+        -----------
+        Returns dict with the average waiting and sojourn time of the customers
+        that departed and the utilization of each server (an array), in one pass
+        over the per-customer trace of a run with `customer_trace=True`.
+        """
+        customers = self.simulation.customers
+        now = self.simulation.now
+        start, departure = customer_times(customers)
+        departed = departure <= now
+        started = customers['server'] != NO_SERVER
+        busy_time = np.minimum(departure[started], now) - start[started]
+        return {
+            "Average waiting time": np.mean((start - customers['arrival'])[departed]),
+            "Average sojourn time": np.mean((departure - customers['arrival'])[departed]),
+            "Server utilization": np.bincount(customers['server'][started], weights=busy_time, minlength=self.c) / now,
+        }
+
+    def get_waiting_time_quantiles(self, quantiles=(0.5, 0.95, 0.99)):
+        """
+        Description
+        -----------
+        Returns dict with quantile: waiting time, exact from the raw logs
+        or approximate (1% relative error) from the streaming sketch.
+        """
+        if self.simulation.stream:
+            sketch = self.simulation.stream.waiting_time_sketch
+            return {q: sketch.quantile(q) for q in quantiles}
+
+        return dict(zip(quantiles, np.quantile(self.simulation.waiting_times, quantiles)))
+
     def to_csv(self, queue_type, seed):
         """
         Saves raw data of simulation to csv. 
         """
-        waiting_times, queue_lengths = self.simulation.get_log()
-        queue_lengths = queue_lengths[:waiting_times.size] # splice to make equal length
-        
-        data = np.vstack((waiting_times, queue_lengths)).T
-        title = f"./data/raw_data/{queue_type}_seed{seed}_rho{self.rho}_max_runtime{self.simulation.max_runtime}_lambda_{self.simulation.mean_arrival_rate}.csv"
-        np.savetxt(title, data, delimiter=',', header="waiting_times,queue_lengths")
-        return
\ No newline at end of file
+        self.save_raw(queue_type, seed, output_format="csv")
+
+    def save_raw(self, queue_type, seed, output_format="csv"):
+        """
+        Saves raw data of simulation in `output_format` ('csv', 'npz' or 'parquet').
+        With a per-customer trace, saves one aligned record per customer
+        (as `customers_*`) instead of the separate waiting times and queue lengths.
+        """
+        from writers import get_writer, simulation_metadata
+
+        writer = get_writer(output_format)
+        metadata = simulation_metadata(self.simulation, queue_system=queue_type, rho=self.rho)
+
+        title = f"{queue_type}_seed{seed}_rho{self.rho}_max_runtime{self.simulation.max_runtime}_lambda_{self.simulation.mean_arrival_rate}.{writer.extension}"
+        if self.simulation.customers is not None:
+            writer.write_customers("./data/raw_data/customers_" + title, self.simulation.customers, metadata)
+        else:
+            waiting_times, queue_lengths = self.simulation.get_log()
+            writer.write_raw("./data/raw_data/" + title, waiting_times, queue_lengths, metadata)
+        return
+
+class NetworkMetrics:
+
+    '''
+    Handles analytic metric calculation of a `QueueNetwork`.
+    '''
+
+    def __init__(self, network):
+        '''
+        Description
+        -----------
+        Solves the traffic equations lambda = gamma + lambda P, i.e.
+        lambda = gamma (I - P)^-1, for the total arrival rate at each station,
+        with gamma the external arrival rates and P the routing matrix.
+
+        Parameters
+        ----------
+        network : `class` QueueNetwork
+        '''
+
+        self.network = network
+        k = len(network.stations)
+        self.arrival_rates = np.linalg.solve(np.eye(k) - network.routing.T, network.arrival_rates)
+        self.c = np.array([station.n_servers for station in network.stations])
+        self.mean_service_times = np.array([mean_service_time(station.B, station.mean_service_rate) for station in network.stations])
+
+        self.rho = self.arrival_rates * self.mean_service_times / self.c
+
+        # every station must be stable
+        assert np.all(self.rho < 1)
+
+
+    def get_expected_metrics(self):
+        """
+        Description
+        -----------
+        Returns a list with a dict of expected performance measures per station.
+        By Jackson's theorem every station of a network of M/M/c FIFO stations
+        behaves as an independent M/M/c queue with the arrival rate of the traffic
+        equations, so this is exact for 'M' service. As in `QueueMetrics`, 'D' and
+        'H' stations use Pollaczek-Khinchine or Allen-Cunneen, which is only an
+        approximation in a network (their departures are not Poisson). Both are
+        FIFO results.
+        """
+        metrics = []
+        for station, arrival_rate, mean, c in zip(self.network.stations, self.arrival_rates, self.mean_service_times, self.c):
+            if station.B == "M":
+                expected = erlang.mmc_metrics(arrival_rate, station.mean_service_rate, c)
+            else:
+                _, scv = service_time_moments(station.B, station.mean_service_rate)
+                expected = erlang.mgc_metrics(arrival_rate, mean, scv, c)
+            expected['arrival rate'] = arrival_rate
+            expected['expected sojourn time'] = expected['expected waiting time'] + mean
+            expected['expected number in system'] = arrival_rate * expected['expected sojourn time']
+            metrics.append(expected)
+        return metrics
+
+
+    def get_expected_network_metrics(self):
+        """
+        Description
+        -----------
+        Returns dict with the expected number of customers in the network and,
+        by Little's law, the expected time a customer spends in the network.
+        """
+        in_network = sum(metrics['expected number in system'] for metrics in self.get_expected_metrics())
+        return {
+            "expected number in network": in_network,
+            "expected sojourn time": in_network / self.network.arrival_rates.sum(),
+        }
+
+
+    def get_measured_metrics(self):
+        """
+        Description
+        -----------
+        Returns a list with a dict of measured performance measures per station,
+        to compare with `get_expected_metrics`.
+        """
+        summary, _ = self.network.get_summary()
+        in_system, in_queue = self.network.get_time_averages()
+        return [
+            {
+                "Average waiting time": avg_wait,
+                "Average queue length": avg_length,
+                "Time-average number in system": in_system[i],
+                "Time-average number in queue": in_queue[i],
+            }
+            for i, (avg_wait, avg_length, _, _) in enumerate(summary)
+        ]
+
+
+    def get_measured_network_metrics(self):
+        """
+        Description
+        -----------
+        Returns dict with the measured time-average number of customers in the
+        network and average time in the network of the customers that left it.
+        """
+        in_system, _ = self.network.get_time_averages()
+        _, avg_sojourn = self.network.get_summary()
+        return {
+            "Time-average number in network": in_system.sum(),
+            "Average sojourn time": avg_sojourn,
+        }
@@ -0,0 +1,290 @@
+'''
+Networks of queueing stations: tandem lines and open (Jackson) networks.
+
+Every station has its own number of servers, mean service rate, service time
+distribution and discipline, as in `QueueSimulation`. Customers arrive from
+outside at any station (Poisson), and after service at station i move to
+station j with probability routing[i][j], or leave with probability
+1 - sum_j routing[i][j]. All stations share one event heap, so a run costs
+O(log pending events) per event, however many stations the network has.
+See `Metrics.NetworkMetrics` for the analytic (Jackson) results.
+'''
+
+import heapq
+import numpy as np
+from bisect import bisect_right
+from collections import deque
+from itertools import count, accumulate
+
+from Queue import SERVICE_DISTRIBUTIONS, BLOCK_SIZE, HeapQueue, variate_stream, draw_inter_arrival_times, draw_service_times
+from streaming import StreamingMetrics
+
+ARRIVAL, DEPARTURE = 0, 1  # event kinds
+
+
+class Station:
+
+    '''
+    Parameters of one station of a `QueueNetwork`, as in `QueueSimulation`.
+    '''
+
+    def __init__(self, n_servers, mean_service_rate, discipline="FIFO", B="M"):
+        if discipline not in ('FIFO', 'SJF'):
+            raise ValueError(f"Unknown discipline '{discipline}', expected 'FIFO' or 'SJF'")
+        if B not in SERVICE_DISTRIBUTIONS:
+            raise ValueError(f"Unknown service time distribution '{B}', expected one of {SERVICE_DISTRIBUTIONS}")
+
+        self.n_servers = n_servers
+        self.mean_service_rate = mean_service_rate
+        self.discipline = discipline
+        self.B = B
+
+    def __repr__(self):
+        return f"Station(n_servers={self.n_servers}, mean_service_rate={self.mean_service_rate}, discipline='{self.discipline}', B='{self.B}')"
+
+
+class QueueNetwork:
+
+    '''
+    Handles simulation of a network of queueing stations.
+    '''
+
+    def __init__(self, stations, routing, arrival_rates, max_customers, max_runtime, seed=None, raw_logs=True):
+        '''
+        Description
+        -----------
+        Initializes the network and its random streams.
+
+        Parameters
+        ----------
+        stations : `list` of `Station`
+            The stations of the network.
+        routing : `np.ndarray`
+            (k, k) routing matrix: routing[i][j] is the probability that a customer
+            goes to station j after service at station i. Rows may sum to less than
+            one; the rest of the customers leave the network.
+        arrival_rates : `np.ndarray`
+            (k,) mean rates of the Poisson arrivals from outside at each station.
+        max_customers : `int`
+            Maximum number of customers entering the network.
+        max_runtime : `float`
+            Maximum runtime of the simulation.
+        seed : `int` or `np.random.SeedSequence`
+            Seed of independent random streams for the arrivals and the service
+            at each station, and for the routing.
+        raw_logs : `bool`
+            Keep every waiting time and queue length per station. If False, only
+            streaming statistics per station (`self.streams`) are kept.
+        '''
+
+        k = len(stations)
+        routing = np.asarray(routing, dtype=float)
+        arrival_rates = np.asarray(arrival_rates, dtype=float)
+        if routing.shape != (k, k) or arrival_rates.shape != (k,):
+            raise ValueError(f"Expected a ({k}, {k}) routing matrix and {k} arrival rates for {k} stations")
+        if np.any(routing < 0) or np.any(routing.sum(axis=1) > 1 + 1e-12):
+            raise ValueError("Routing probabilities must be non-negative and sum to at most one per station")
+        if np.any(arrival_rates < 0) or not arrival_rates.sum() > 0:
+            raise ValueError("Arrival rates must be non-negative, with at least one positive rate")
+
+        # Initialize network parameters:
+        self.stations = list(stations)
+        self.routing = routing
+        self.arrival_rates = arrival_rates
+        self.max_customers = max_customers
+        self.max_runtime = max_runtime
+        self.seed = seed
+        self.now = 0.0
+
+        # Initialize logs per station (their length is not known in advance
+        # with feedback) or streaming statistics:
+        self.raw_logs = raw_logs
+        self.waiting_times = [[] for _ in range(k)]
+        self.queue_lengths = [[] for _ in range(k)]
+        self.streams = [StreamingMetrics() for _ in range(k)] if not raw_logs else None
+        self.area_queue = np.zeros(k)
+        self.area_service = np.zeros(k)
+
+        # Time in the network of each customer:
+        self.entry_times = np.full(max_customers, np.NaN)
+        self.sojourn_times = np.full(max_customers, np.NaN)
+        self.n_arrived = 0
+        self.n_departed = 0
+
+        # Independent random streams for the arrivals at and service of
+        # each station, and for the routing, drawn in blocks:
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        rngs = [np.random.default_rng(child) for child in seed.spawn(2 * k + 1)]
+        block_size = min(BLOCK_SIZE, max_customers)
+        self.next_inter_arrival = [
+            variate_stream(lambda size, rng=rng, rate=rate: draw_inter_arrival_times(rng, rate, size), block_size).__next__ if rate > 0 else None
+            for rng, rate in zip(rngs[:k], arrival_rates)
+        ]
+        self.next_service = [
+            variate_stream(lambda size, rng=rng, station=station: draw_service_times(rng, station.B, station.mean_service_rate, size), block_size).__next__
+            for rng, station in zip(rngs[k:2 * k], self.stations)
+        ]
+        self.next_route = variate_stream(rngs[-1].random, block_size).__next__
+
+
+    @classmethod
+    def tandem(cls, stations, arrival_rate, max_customers, max_runtime, seed=None, raw_logs=True):
+        '''
+        Returns a tandem line: customers arrive at the first station and visit every station in order.
+        '''
+        k = len(stations)
+        routing = np.eye(k, k=1)
+        arrival_rates = np.zeros(k)
+        arrival_rates[0] = arrival_rate
+        return cls(stations, routing, arrival_rates, max_customers, max_runtime, seed, raw_logs)
+
+
+    def run(self):
+        '''
+        Runs the simulation as a single event loop over all stations.
+
+        Events are (time, sequence number, kind, station, customer) in one
+        min-heap; the sequence number keeps events at equal times in the order
+        they were scheduled. As in `QueueSimulation.run_native`, the area under
+        the number in queue (in service) per station is the sum of waiting
+        (service) times, cut off at the end of the run.
+        '''
+
+        k = len(self.stations)
+        max_customers, max_runtime = self.max_customers, self.max_runtime
+        heappush, heappop = heapq.heappush, heapq.heappop
+        next_inter_arrival, next_service, next_route = self.next_inter_arrival, self.next_service, self.next_route
+        n_servers = [station.n_servers for station in self.stations]
+        sjf = [station.discipline == 'SJF' for station in self.stations]
+        routes = [list(accumulate(row)) for row in self.routing.tolist()]  # cumulative routing probabilities
+        entry_times, sojourn_times = self.entry_times, self.sojourn_times
+        area_queue, area_service = self.area_queue, self.area_service
+
+        if self.raw_logs:
+            log_wait = [log.append for log in self.waiting_times]
+            log_length = [log.append for log in self.queue_lengths]
+        else:
+            log_wait = [stream.add_waiting_time for stream in self.streams]
+            log_length = [stream.add_queue_length for stream in self.streams]
+
+        busy = [0] * k
+        waiting = [HeapQueue() if sjf[i] else deque() for i in range(k)]
+        dequeue = [waiting[i].pop if sjf[i] else waiting[i].popleft for i in range(k)]
+        sequence = count()
+        events = []  # min-heap of events
+        for i in range(k):
+            if next_inter_arrival[i]:
+                heappush(events, (0.0, next(sequence), ARRIVAL, i, -1))
+
+        now = 0.0
+        n_arrived = n_departed = 0
+
+        while events:
+
+            time, _, kind, i, customer = events[0]
+            if time >= max_runtime:
+                now = max_runtime
+                break
+            heappop(events)
+
+            # Arrivals past `max_customers` are dropped without moving the clock:
+            if kind == ARRIVAL and n_arrived >= max_customers:
+                continue
+            now = time
+
+            if kind == ARRIVAL:
+                # Arrival from outside, the next one is scheduled at the same station
+                # until `max_customers` have arrived:
+                customer = n_arrived
+                n_arrived += 1
+                entry_times[customer] = now
+                if n_arrived < max_customers:
+                    heappush(events, (now + next_inter_arrival[i](), next(sequence), ARRIVAL, i, -1))
+
+            else:
+                # Service completion, start service of next customer in queue:
+                if waiting[i]:
+                    arrival_time, t_service, next_customer = dequeue[i]()
+                    t_wait = now - arrival_time
+                    log_wait[i](t_wait)
+                    area_queue[i] += t_wait
+                    area_service[i] += t_service
+                    heappush(events, (now + t_service, next(sequence), DEPARTURE, i, next_customer))
+                else:
+                    busy[i] -= 1
+
+                # Route the customer to the next station or out of the network:
+                i = bisect_right(routes[i], next_route())
+                if i == k:
+                    sojourn_times[customer] = now - entry_times[customer]
+                    n_departed += 1
+                    continue
+
+            # Customer joins station i: serve immediately if a server is free, else queue:
+            log_length[i](len(waiting[i]))
+            t_service = next_service[i]()
+            if busy[i] < n_servers[i]:
+                busy[i] += 1
+                log_wait[i](0.0)
+                area_service[i] += t_service
+                heappush(events, (now + t_service, next(sequence), DEPARTURE, i, customer))
+            elif sjf[i]:
+                waiting[i].push(t_service, (now, t_service, customer))
+            else:
+                waiting[i].append((now, t_service, customer))
+
+        self.now = now
+        self.n_arrived, self.n_departed = n_arrived, n_departed
+
+        # Add the waits of customers still in queue and remove the
+        # service after the end of customers still in service:
+        for i in range(k):
+            area_queue[i] += sum(now - arrival_time for arrival_time, *_ in waiting[i])
+        for time, _, kind, i, _ in events:
+            if kind == DEPARTURE:
+                area_service[i] -= time - now
+
+        self.in_queue = np.array([len(queue) for queue in waiting])
+        self.in_system = np.array(busy) + self.in_queue
+
+
+    def get_log(self, station):
+        '''
+        Returns `waiting_times` and `queue_lengths` of `station` (raw logs only).
+        '''
+        return np.array(self.waiting_times[station]), np.array(self.queue_lengths[station])
+
+    def get_time_averages(self):
+        '''
+        Returns arrays of the time-average number of customers in system and in queue per station.
+        '''
+        return (self.area_queue + self.area_service) / self.now, self.area_queue / self.now
+
+    def get_sojourn_times(self):
+        '''
+        Returns the time in the network of the customers that left it.
+        '''
+        return self.sojourn_times[~np.isnan(self.sojourn_times)]
+
+    def get_summary(self):
+        '''
+        Returns a list with (average waiting time, average queue length, n_wait, n_queue) per
+        station, as `QueueSimulation.get_summary`, and the average time in the network.
+        '''
+        summary = []
+        for i in range(len(self.stations)):
+            if self.streams:
+                waiting_times, queue_lengths = self.streams[i].waiting_times, self.streams[i].queue_lengths
+                summary.append((
+                    waiting_times.mean if waiting_times.n else np.NaN, queue_lengths.mean if queue_lengths.n else np.NaN,
+                    waiting_times.n, queue_lengths.n
+                ))
+            else:
+                waiting_times, queue_lengths = self.get_log(i)
+                summary.append((
+                    waiting_times.mean() if waiting_times.size else np.NaN, queue_lengths.mean() if queue_lengths.size else np.NaN,
+                    waiting_times.size, queue_lengths.size
+                ))
+        sojourn_times = self.get_sojourn_times()
+        return summary, sojourn_times.mean() if sojourn_times.size else np.NaN
@@ -1,16 +1,377 @@
-import simpy
-import random
+import heapq
+import warnings
+import importlib.util
 import numpy as np
+from collections import deque
+from contextlib import nullcontext
+from itertools import count
+from streaming import StreamingMetrics, TimeWeightedState
+from profiling import Profiler
 # import pandas as pd
 
 
+ENGINES = ('simpy', 'native', 'vectorized', 'jit')
+SERVICE_DISTRIBUTIONS = ('M', 'D', 'H')
+BLOCK_SIZE = 4096  # number of variates drawn per call to the generator
+TRACE_POINTS = 10_000  # default number of points in the N_t trace
+
+# Per-customer trace (`QueueSimulation(..., customer_trace=True)`), one packed
+# 26-byte record per customer, indexed by customer id (arrival order). Start
+# and departure are stored as float32 durations after the arrival, which keep
+# their relative precision in long runs, unlike float32 absolute times:
+CUSTOMER_DTYPE = np.dtype([
+    ('id', np.uint32),
+    ('arrival', np.float64),
+    ('wait', np.float32),  # NaN if not started before the end of the run
+    ('service', np.float32),
+    ('server', np.uint16),  # NO_SERVER if not started
+    ('queue_length', np.uint32),  # number waiting at arrival
+])
+NO_SERVER = np.iinfo(np.uint16).max
+
+
+def make_streams(seed):
+    '''
+    Returns independent (arrival, service) NumPy generators spawned
+    from `seed`, which may be an `int`, `None` or a `np.random.SeedSequence`.
+    '''
+
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    arrival_seed, service_seed = seed.spawn(2)
+    return np.random.default_rng(arrival_seed), np.random.default_rng(service_seed)
+
+
+def draw_inter_arrival_times(rng, arrival_rate, size):
+    '''
+    Returns an array of `size` exponential inter-arrival times drawn from `rng`.
+    '''
+    return rng.exponential(1 / arrival_rate, size)
+
+
+def draw_service_times(rng, B, service_rate, size):
+    '''
+    Returns an array of `size` service times drawn from `rng`
+    for service time distribution `B` ('M', 'D' or 'H').
+    Variates are consumed in customer order, so drawing in blocks
+    gives the same sequence as drawing everything at once.
+    '''
+
+    if B == "M":
+        return rng.exponential(1 / service_rate, size)
+    elif B == "D":
+        return np.full(size, 1 / service_rate)
+    elif B == "H":
+        return rng.standard_exponential((size, 2)) @ np.array([0.75 * 1.0, 0.25 / 5.0])
+    raise KeyError(B)
+
+
+def service_time_moments(B, service_rate):
+    '''
+    Returns the mean and squared coefficient of variation (variance / mean^2)
+    of service times of distribution `B`. 'H' is the weighted sum of two
+    unit exponentials in `draw_service_times`, independent of `service_rate`.
+    '''
+
+    if B == "M":
+        return 1 / service_rate, 1.0
+    elif B == "D":
+        return 1 / service_rate, 0.0
+    elif B == "H":
+        weights = np.array([0.75 * 1.0, 0.25 / 5.0])
+        return weights.sum(), np.sum(weights**2) / weights.sum()**2
+    raise KeyError(B)
+
+
+def mean_service_time(B, service_rate):
+    '''
+    Returns the expected service time of distribution `B`.
+    '''
+    return service_time_moments(B, service_rate)[0]
+
+
+def inverse_inter_arrival_times(uniforms, arrival_rate):
+    '''
+    Returns exponential inter-arrival times by inverse transform of `uniforms`.
+    '''
+    return -np.log1p(-uniforms) / arrival_rate
+
+
+def inverse_service_times(uniforms, B, service_rate):
+    '''
+    Returns service times of distribution `B` by inverse transform of
+    `uniforms`, an array of shape (size, 2) (one column per exponential
+    phase of 'H', only the first is used for 'M').
+    '''
+
+    if B == "M":
+        return -np.log1p(-uniforms[:, 0]) / service_rate
+    elif B == "D":
+        return np.full(uniforms.shape[0], 1 / service_rate)
+    elif B == "H":
+        return -np.log1p(-uniforms) @ np.array([0.75 * 1.0, 0.25 / 5.0])
+    raise KeyError(B)
+
+
+class CommonRandomNumbers:
+
+    '''
+    Pre-generated uniforms for the arrivals and services of `max_customers`
+    customers, to be shared by simulations of different configurations
+    (common random numbers). Variates follow by inverse transform, so
+    customer k gets the same uniforms in every system, and `antithetic()`
+    returns the mirrored streams 1 - U for antithetic pairs.
+    '''
+
+    def __init__(self, seed, max_customers):
+        arrival_rng, service_rng = make_streams(seed)
+        self.seed = seed
+        self.arrival_uniforms = arrival_rng.random(max_customers)
+        self.service_uniforms = service_rng.random((max_customers, 2))
+        self.is_antithetic = False
+
+
+    def antithetic(self):
+        '''
+        Returns streams with the antithetic uniforms 1 - U.
+        '''
+        streams = CommonRandomNumbers.__new__(CommonRandomNumbers)
+        streams.seed = self.seed
+        streams.arrival_uniforms = 1 - self.arrival_uniforms
+        streams.service_uniforms = 1 - self.service_uniforms
+        streams.is_antithetic = not self.is_antithetic
+        return streams
+
+
+    def variates(self, mean_arrival_rate, B, mean_service_rate, max_customers):
+        '''
+        Returns the inter-arrival and service times of the first `max_customers` customers.
+        '''
+        if max_customers > self.arrival_uniforms.size:
+            raise ValueError(f"Streams hold {self.arrival_uniforms.size} customers, {max_customers} requested")
+        return (
+            inverse_inter_arrival_times(self.arrival_uniforms[:max_customers], mean_arrival_rate),
+            inverse_service_times(self.service_uniforms[:max_customers], B, mean_service_rate),
+        )
+
+
+def variate_stream(draw, block_size=BLOCK_SIZE):
+    '''
+    Yields scalar variates one at a time from blocks of `block_size`,
+    where `draw(size)` returns an array of `size` variates.
+    '''
+    while True:
+        yield from draw(block_size).tolist()
+
+
+def draw_fifo_arrays(arrival_rng, service_rng, B, mean_arrival_rate, mean_service_rate, max_customers, streams=None):
+    '''
+    Returns arrival and service times of `max_customers` customers,
+    drawn up front from the given arrival and service generators
+    or, if given, from shared `CommonRandomNumbers` streams.
+    The first customer arrives at t=0.
+    '''
+
+    if streams is None:
+        inter_arrival_times = draw_inter_arrival_times(arrival_rng, mean_arrival_rate, max_customers)
+        service_times = draw_service_times(service_rng, B, mean_service_rate, max_customers)
+    else:
+        inter_arrival_times, service_times = streams.variates(mean_arrival_rate, B, mean_service_rate, max_customers)
+    arrival_times = np.concatenate(([0.0], np.cumsum(inter_arrival_times[:-1])))
+    return arrival_times, service_times
+
+
+def fifo_start_times(arrival_times, service_times, n_servers):
+    '''
+    Returns the service start times of FIFO customers.
+    Accepts a single run (1-D) or one replication per row (2-D).
+
+    For a single server this is the Lindley recursion, evaluated without
+    a Python loop as W_k = X_k - min_{j<=k} X_j with X the cumulative sum
+    of S_{k-1} - A_k. For multiple servers it is the Kiefer-Wolfowitz
+    recursion: each customer starts on the server that frees up first.
+    Replications then advance in lockstep, one customer per step.
+    '''
+
+    if n_servers == 1:
+        X = np.cumsum(service_times[..., :-1] - np.diff(arrival_times, axis=-1), axis=-1)
+        X = np.concatenate((np.zeros_like(arrival_times[..., :1]), X), axis=-1)
+        return arrival_times + (X - np.minimum.accumulate(X, axis=-1))
+
+    if arrival_times.ndim == 2 and arrival_times.shape[0] > 1:
+        rows = np.arange(arrival_times.shape[0])
+        free = np.zeros((arrival_times.shape[0], n_servers))  # server free times
+        start_times = np.empty_like(arrival_times)
+        for k in range(arrival_times.shape[1]):
+            server = free.argmin(axis=1)
+            start = np.maximum(arrival_times[:, k], free[rows, server])
+            free[rows, server] = start + service_times[:, k]
+            start_times[:, k] = start
+        return start_times
+
+    free = [0.0] * n_servers  # min-heap of server free times
+    start_times = np.empty_like(arrival_times)
+    for i, (arrival_time, t_service) in enumerate(zip(arrival_times.ravel().tolist(), service_times.ravel().tolist())):
+        start = max(arrival_time, free[0])
+        heapq.heapreplace(free, start + t_service)
+        start_times.flat[i] = start
+
+    return start_times
+
+
+def fifo_queue_lengths(arrival_times, start_times):
+    '''
+    Returns the number of customers waiting in a FIFO queue
+    upon each arrival, i.e. earlier customers not yet in service.
+    FIFO start times are non-decreasing, so this is a sorted search.
+    '''
+
+    if arrival_times.ndim == 2:
+        return np.stack([fifo_queue_lengths(a, s) for a, s in zip(arrival_times, start_times)])
+
+    i = np.arange(arrival_times.size)
+    started = np.minimum(np.searchsorted(start_times, arrival_times, side='right'), i)
+    return (i - started).astype(float)
+
+
+def assign_servers(start_times, departure_times, n_servers):
+    '''
+    Returns the server index of each customer (`NO_SERVER` if the start time is NaN).
+    Servers are identical, so each customer is assigned, in order of start time,
+    to the server that has been free the longest (the lowest index at ties).
+    '''
+    servers = np.full(start_times.size, NO_SERVER, dtype=np.uint16)
+    order = np.argsort(start_times, kind='stable')[:np.count_nonzero(~np.isnan(start_times))]
+    free = [(0.0, k) for k in range(n_servers)]  # heap of (time server is free, server)
+    departure_times = departure_times.tolist()
+
+    for i in order.tolist():
+        k = free[0][1]
+        servers[i] = k
+        heapq.heapreplace(free, (departure_times[i], k))
+    return servers
+
+
+def customer_times(customers):
+    '''
+    Returns the (start, departure) times of a customer trace (`CUSTOMER_DTYPE`) as float64.
+    '''
+    start = customers['arrival'] + customers['wait']
+    return start, start + customers['service']
+
+
+def step_area(up_times, down_times, horizon):
+    '''
+    Returns the integral over [0, horizon] of the number of `up_times`
+    minus the number of `down_times` at or before t, f.e. the number of
+    customers in system with arrival and departure times.
+    '''
+
+    times = np.minimum(np.concatenate((up_times, down_times)), horizon)
+    steps = np.concatenate((np.ones(up_times.size), -np.ones(down_times.size)))
+    order = np.argsort(times, kind='stable')
+    times, counts = times[order], np.cumsum(steps[order])
+    return np.sum(counts * np.diff(times, append=horizon))
+
+
+def simulate_fifo_replications(n_servers, mean_service_rate, mean_arrival_rate, max_customers, max_runtime, seeds, B="M"):
+    '''
+    Description
+    -----------
+    Simulates one FIFO replication per seed, all in lockstep on 2-D arrays.
+    Row i equals the log of a vectorized `QueueSimulation` with seed `seeds[i]`.
+
+    Parameters
+    ----------
+    n_servers, mean_service_rate, mean_arrival_rate, max_customers, max_runtime, B :
+        As in `QueueSimulation`.
+    seeds : `list` of `int`
+        One seed per replication.
+
+    Returns
+    -------
+    waiting_times, queue_lengths : `np.ndarray`
+        (len(seeds), max_customers) matrices. Entries for customers that
+        start service (resp. arrive) after `max_runtime` are NaN, so use
+        `np.nanmean(..., axis=1)` for averages per replication.
+    '''
+
+    arrays = [draw_fifo_arrays(*make_streams(seed), B, mean_arrival_rate, mean_service_rate, max_customers) for seed in seeds]
+    arrival_times = np.stack([a for a, _ in arrays])
+    service_times = np.stack([s for _, s in arrays])
+    start_times = fifo_start_times(arrival_times, service_times, n_servers)
+
+    waiting_times = start_times - arrival_times
+    queue_lengths = fifo_queue_lengths(arrival_times, start_times)
+    waiting_times[start_times >= max_runtime] = np.NaN
+    queue_lengths[arrival_times >= max_runtime] = np.NaN
+
+    return waiting_times, queue_lengths
+
+
+class HeapQueue(list):
+
+    '''
+    Priority queue on a binary heap: O(log n) insertion and removal of the
+    item with the lowest priority, O(1) length and peek. Items of equal
+    priority leave in insertion order, as with a stable sort on priority.
+
+    Besides `push`, it offers the put-queue interface SimPy relies on
+    (`append`, `len`, `[0]`, `pop(0)` and `remove`), with the priority of
+    an appended item given by `key(item)`. See `simpy_resources.HeapPriorityResource`.
+    The list itself holds the heap of (priority, insertion count, item).
+    '''
+
+    def __init__(self, key=None):
+        super().__init__()
+        self.counter = count()
+        self.key = key
+
+    def __iter__(self):
+        '''
+        Yields the items in heap order (not sorted).
+        '''
+        return (entry[2] for entry in list.__iter__(self))
+
+    def __getitem__(self, index):
+        if index != 0:
+            raise IndexError("Only the first item of a HeapQueue can be accessed")
+        return list.__getitem__(self, 0)[2]
+
+    def push(self, priority, item):
+        heapq.heappush(self, (priority, next(self.counter), item))
+
+    def append(self, item):
+        self.push(self.key(item), item)
+
+    def pop(self, index=0):
+        '''
+        Removes and returns the item with the lowest priority.
+        '''
+        if index != 0:
+            raise IndexError("Only the first item of a HeapQueue can be popped")
+        return heapq.heappop(self)[2]
+
+    def remove(self, item):
+        '''
+        Removes `item` (O(n), only used when a request is cancelled).
+        '''
+        for i, entry in enumerate(list.__iter__(self)):
+            if entry[2] is item:
+                self[i] = list.__getitem__(self, -1)
+                list.pop(self)
+                heapq.heapify(self)
+                return
+        raise ValueError(f"{item} not in queue")
+
+
 class QueueSimulation:
     
     '''
     Handles simulation of queueing system.
     '''
     
-    def __init__(self, n_servers, discipline, mean_service_rate, mean_arrival_rate, max_customers, max_runtime, seed=None, B="M"):
+    def __init__(self, n_servers, discipline, mean_service_rate, mean_arrival_rate, max_customers, max_runtime, seed=None, B="M", engine="simpy", raw_logs=True, trace_points=None, streams=None, profile=False, customer_trace=False):
         '''
         Description
         -----------
@@ -30,19 +391,60 @@ class QueueSimulation:
             Maximum number of customers to simulate.
         max_runtime : `float`
             Maximum runtime of the simulation.
-        seed : `int`
-            Seed for random number generator.
+        seed : `int` or `np.random.SeedSequence`
+            Seed for the simulation's own arrival and service random streams.
         B : `str`
             Service time distribution. 
             'M': exponential, 
             'D': deterministic, or 
             'H': hyperexponential.
+        engine : `str`
+            Simulation engine.
+            'simpy': process-based simulation using SimPy, or
+            'native': heap-based event loop without SimPy, or
+            'vectorized': FIFO-only Lindley/Kiefer-Wolfowitz recursion on NumPy arrays, or
+            'jit': the native event loop compiled with Numba (see `kernels`), which
+            falls back to 'native' if Numba is not installed.
+        raw_logs : `bool`
+            Keep every waiting time and queue length. If False, only streaming
+            statistics (`self.stream`) are kept, with memory independent of
+            the number of customers.
+        trace_points : `int`
+            Number of equally spaced times in [0, max_runtime) at which the number
+            of customers in system is traced (`self.t`, `self.N_t`). Defaults to
+            min(max_customers, TRACE_POINTS) with raw logs, else 0 (no trace).
+        streams : `CommonRandomNumbers`
+            Shared pre-generated random streams, used instead of drawing from
+            `seed`, so that compared systems see common random numbers.
+        profile : `bool`
+            Count events and time the run by section (see `get_profile`).
+            Off by default, in which case the run is not instrumented at all.
+        customer_trace : `bool`
+            Keep one record per customer in `self.customers` (see `CUSTOMER_DTYPE`):
+            arrival, waiting and service time, server and queue length at arrival.
         '''
 
-        if seed is not None: random.seed(seed)
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+        if engine == 'vectorized' and discipline != 'FIFO':
+            raise ValueError("The vectorized engine only supports the FIFO discipline")
+
+        if B not in SERVICE_DISTRIBUTIONS:
+            raise ValueError(f"Unknown service time distribution '{B}', expected one of {SERVICE_DISTRIBUTIONS}")
+
+        if engine == 'jit' and importlib.util.find_spec('numba') is None:
+            warnings.warn("Numba is not installed, using the native engine instead of 'jit'", RuntimeWarning)
+            engine = 'native'
 
         # Initialize simulation environment:
-        self.env = simpy.Environment()
+        self.engine = engine
+        # SimPy is only imported by the SimPy engine:
+        if engine == 'simpy':
+            import simpy
+            self.env = simpy.Environment()
+        else:
+            self.env = None
+        self.now = 0.0
 
         # Initialize simulation parameters:
         self.n_servers = n_servers
@@ -51,34 +453,96 @@ class QueueSimulation:
         self.mean_arrival_rate = mean_arrival_rate
         self.max_customers = max_customers
         self.max_runtime = max_runtime
+        self.seed = seed if streams is None else streams.seed
+        self.B = B
+        self.streams = streams
         
-        # Initialize log:
-        self.waiting_times = np.array([])
-        self.queue_lengths = np.array([])
-        self.t = np.full(max_customers, np.NaN)
-        self.N_t = np.full(max_customers, np.NaN)
+        # Initialize log (preallocated, filled up to a write cursor)
+        # or streaming statistics:
+        self.raw_logs = raw_logs
+        self.stream = None if raw_logs else StreamingMetrics()
+        log_size = max_customers if raw_logs else 0
+        self.waiting_times = np.full(log_size, np.NaN)
+        self.queue_lengths = np.full(log_size, np.NaN)
+        self.n_waiting_times = 0
+        self.n_queue_lengths = 0
+
+        # Per-customer trace, preallocated like the logs:
+        if customer_trace and n_servers >= NO_SERVER:
+            raise ValueError(f"The customer trace supports at most {NO_SERVER - 1} servers")
+        self.customers = np.zeros(max_customers, dtype=CUSTOMER_DTYPE) if customer_trace else None
+        if customer_trace:
+            self.customers['id'] = np.arange(max_customers)
+            self.customers['wait'] = np.NaN
+
+        # Time-weighted number in system and in queue, with a decimated trace:
+        if trace_points is None:
+            trace_points = min(max_customers, TRACE_POINTS) if raw_logs else 0
+        self.state = TimeWeightedState(max_runtime, trace_points)
+        self.t = self.state.t
+        self.N_t = self.state.N_t
+
+        # Initialize independent random streams for arrivals and service,
+        # drawn in blocks and handed out one variate at a time, or
+        # handed out from shared streams:
+        if streams is None:
+            self.arrival_rng, self.service_rng = make_streams(seed)
+            block_size = min(BLOCK_SIZE, max_customers)
+            self.next_inter_arrival = variate_stream(
+                lambda size: draw_inter_arrival_times(self.arrival_rng, mean_arrival_rate, size), block_size
+            ).__next__
+            self.next_service = variate_stream(
+                lambda size: draw_service_times(self.service_rng, B, mean_service_rate, size), block_size
+            ).__next__
+        else:
+            self.arrival_rng = self.service_rng = None
+            inter_arrival_times, service_times = streams.variates(mean_arrival_rate, B, mean_service_rate, max_customers)
+            self.next_inter_arrival = iter(inter_arrival_times.tolist()).__next__
+            self.next_service = iter(service_times.tolist()).__next__
 
-        # Initialize service time distribution:
-        distributions = {
-            "M": random.expovariate,
-            "D": lambda x : 1/x,
-            "H": lambda x : 0.75 * random.expovariate(1.0) + 0.25 * random.expovariate(5.0) 
-        }
-        self.service_distribution = distributions[B]
+        self.profiler = Profiler() if profile else None
 
 
     def run(self):
         '''
-        Initializes server and starts arrivals.
+        Runs the simulation with the selected engine.
+        For SimPy, initializes server and starts arrivals.
         '''
 
-        self.server = simpy.PriorityResource(self.env, capacity=self.n_servers)
-        self.env.process(self.arrivals())
-        self.env.run(until=self.max_runtime)
+        if self.profiler: self.profiler.begin(self)
 
-        # Remove NaNs from logged data:
-        self.t = self.t[~np.isnan(self.t)]
-        self.N_t = self.N_t[~np.isnan(self.N_t)]
+        if self.engine == 'simpy':
+            from simpy_resources import HeapPriorityResource
+            self.server = HeapPriorityResource(self.env, capacity=self.n_servers)
+            self.env.process(self.arrivals())
+            self.env.run(until=self.max_runtime)
+            # The run ends at max_runtime, or at the last departure if all customers left before:
+            emptied = self.n_queue_lengths == self.max_customers and not self.state.in_system
+            self.now = self.state.time if emptied else self.env.now
+        elif self.engine == 'native':
+            self.run_native()
+        elif self.engine == 'jit':
+            self.run_jit()
+        else:
+            self.run_vectorized()
+
+        # Trim logs to the number of written entries:
+        self.waiting_times = self.waiting_times[:self.n_waiting_times]
+        self.queue_lengths = self.queue_lengths[:self.n_queue_lengths]
+
+        # Integrate the state up to the end of the run (the last departure
+        # if all customers left before max_runtime) and trim the trace:
+        if self.n_queue_lengths < self.max_customers or self.state.in_system:
+            self.state.advance(self.now)
+        self.t = self.state.t[:self.state.n_trace]
+        self.N_t = self.state.N_t[:self.state.n_trace]
+
+        # Trim the customer trace to the customers that arrived and assign servers:
+        if self.customers is not None:
+            self.customers = self.customers[:self.n_queue_lengths]
+            self.customers['server'] = assign_servers(*customer_times(self.customers), self.n_servers)
+
+        if self.profiler: self.profiler.end(self)
 
     def arrivals(self):
         '''
@@ -96,7 +560,7 @@ class QueueSimulation:
             self.env.process(new_customer)
             
             # Wait for next customer (assuming exponential inter-arrival times):
-            t_inter_arrival = random.expovariate(self.mean_arrival_rate)
+            t_inter_arrival = self.next_inter_arrival()
             yield self.env.timeout(t_inter_arrival)
 
 
@@ -105,12 +569,25 @@ class QueueSimulation:
         Handles customer service upon arrival. 
         Depends on server discipline.
         '''
+        state = self.state
+        state.advance(self.env.now)
+        state.in_system += 1
+        state.in_queue += 1
+
         # Assess system state upon arrival:
-        self.queue_lengths = np.append(self.queue_lengths, len(self.server.put_queue))  # NOTE: does order matter here?
+        if self.stream: self.stream.add_queue_length(len(self.server.put_queue))
+        else: self.queue_lengths[self.n_queue_lengths] = len(self.server.put_queue)  # NOTE: does order matter here?
+        self.n_queue_lengths += 1
         arrival_time = self.env.now
 
         # Prepare service:
-        t_inter_service = self.service_distribution(self.mean_service_rate)
+        t_inter_service = self.next_service()
+
+        customers = self.customers
+        if customers is not None:
+            customers['arrival'][id - 1] = arrival_time
+            customers['service'][id - 1] = t_inter_service
+            customers['queue_length'][id - 1] = len(self.server.put_queue)
         
         # Check for discipline:
         if self.discipline == 'FIFO': prio = 0  # all customers have equal priority
@@ -121,27 +598,276 @@ class QueueSimulation:
             
             # Wait in queue until turn comes:
             yield request
+            state.advance(self.env.now)
+            state.in_queue -= 1
             
             # Arrival at server:
-            self.waiting_times = np.append(self.waiting_times, self.env.now - arrival_time)  # NOTE: does order matter here?
+            if self.stream: self.stream.add_waiting_time(self.env.now - arrival_time)
+            else: self.waiting_times[self.n_waiting_times] = self.env.now - arrival_time  # NOTE: does order matter here?
+            self.n_waiting_times += 1
+            if customers is not None: customers['wait'][id - 1] = self.env.now - arrival_time
             
             # print("[%7.4fs] ID %s: Arrived (waited %6.3fs)" % (self.env.now, id, waiting_time))
 
             # Service:
             yield self.env.timeout(t_inter_service)
+            state.advance(self.env.now)
+            state.in_system -= 1
 
             # print("[%7.4fs] ID %s: Finished." % (self.env.now, id))
 
 
+    def run_native(self):
+        '''
+        Runs the simulation as a single heap-based event loop.
+
+        Customers in service are kept in a min-heap of departure times
+        (i.e. server free times), waiting customers in a FIFO deque or,
+        for SJF, a `HeapQueue` on service time. Each customer takes the
+        same variates as in the SimPy engine, so a seed gives the same log.
+        Rather than integrating the state at every event, the area under
+        the number in queue is the sum of waiting times and the area under
+        the number in service the sum of service times, both cut off at
+        the end of the run.
+        '''
+
+        c = self.n_servers
+        max_customers = self.max_customers
+        max_runtime = self.max_runtime
+        next_inter_arrival, next_service = self.next_inter_arrival, self.next_service
+        sjf = self.discipline == 'SJF'
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        waiting_times, queue_lengths = self.waiting_times, self.queue_lengths
+        n_waiting, n_queue = self.n_waiting_times, self.n_queue_lengths
+        stream = self.stream
+        state = self.state
+        area_queue = area_service = 0.0
+        next_trace = state.next_trace
+        customers = self.customers
+        if customers is not None:
+            arrivals, waits, services, queued = (customers[field] for field in ('arrival', 'wait', 'service', 'queue_length'))
+
+        departures = []  # min-heap of departure times
+        waiting = HeapQueue() if sjf else deque()
+        dequeue = waiting.pop if sjf else waiting.popleft
+        now = next_arrival = 0.0
+        customer_id = 0
+
+        while True:
+
+            departure = departures and (departures[0] <= next_arrival or customer_id >= max_customers)
+            if departure: now = departures[0]
+            elif customer_id >= max_customers: break
+            else: now = next_arrival
+            if now >= max_runtime: break
+
+            if next_trace < now: next_trace = state.trace(now, len(departures) + len(waiting))
+
+            # Next event is a departure:
+            if departure:
+                heappop(departures)
+
+                # Start service of next customer in queue:
+                if waiting:
+                    arrival_time, t_service, i = dequeue()
+                    t_wait = now - arrival_time
+                    if stream: stream.add_waiting_time(t_wait)
+                    else: waiting_times[n_waiting] = t_wait
+                    n_waiting += 1
+                    if customers is not None: waits[i] = t_wait
+                    area_queue += t_wait
+                    area_service += t_service
+                    heappush(departures, now + t_service)
+
+            # Next event is an arrival:
+            else:
+                customer_id += 1
+                if stream: stream.add_queue_length(len(waiting))
+                else: queue_lengths[n_queue] = len(waiting)
+                n_queue += 1
+                next_arrival = now + next_inter_arrival()
+                t_service = next_service()
+                i = customer_id - 1
+                if customers is not None:
+                    arrivals[i], services[i], queued[i] = now, t_service, len(waiting)
+
+                # Serve immediately if a server is free, else join queue:
+                if len(departures) < c:
+                    if stream: stream.add_waiting_time(0.0)
+                    else: waiting_times[n_waiting] = 0.0
+                    n_waiting += 1
+                    if customers is not None: waits[i] = 0.0
+                    area_service += t_service
+                    heappush(departures, now + t_service)
+                elif sjf:
+                    waiting.push(t_service, (now, t_service, i))
+                else:
+                    waiting.append((now, t_service, i))
+
+        self.now = min(now, max_runtime)
+        self.n_waiting_times, self.n_queue_lengths = n_waiting, n_queue
+
+        # Add the waits of customers still in queue and remove the
+        # service after the end of customers still in service:
+        area_queue += sum(self.now - arrival_time for arrival_time, *_ in waiting)
+        area_service -= sum(departure - self.now for departure in departures)
+        state.area_queue, state.area_system = area_queue, area_queue + area_service
+        state.time, state.next_trace = self.now, next_trace
+        state.in_queue = len(waiting)
+        state.in_system = len(departures) + state.in_queue
+
+
+    def run_jit(self):
+        '''
+        Runs the event loop of `run_native` as a Numba-compiled kernel
+        (`kernels.event_loop`), on variates drawn up front from the same
+        streams, so a seed gives the same log. Streaming statistics are
+        fed from the logs after the run.
+        '''
+        from kernels import event_loop
+
+        section = self.profiler.section if self.profiler else lambda name: nullcontext()
+        n = self.max_customers
+
+        with section('variates'):
+            if self.streams is None:
+                times = draw_inter_arrival_times(self.arrival_rng, self.mean_arrival_rate, n)
+                service_times = draw_service_times(self.service_rng, self.B, self.mean_service_rate, n)
+            else:
+                times, service_times = self.streams.variates(self.mean_arrival_rate, self.B, self.mean_service_rate, n)
+
+        waiting_times, queue_lengths = (np.empty(n), np.empty(n)) if self.stream else (self.waiting_times, self.queue_lengths)
+        waits = np.full(n if self.customers is not None else 0, np.NaN)
+        state = self.state
+
+        (
+            self.now, self.n_waiting_times, self.n_queue_lengths, state.area_queue, area_service,
+            state.in_queue, in_service, state.n_trace, state.next_trace
+        ) = event_loop(
+            times, service_times, self.n_servers, self.discipline == 'SJF', self.max_runtime, waiting_times, queue_lengths,
+            waits, state.t, state.N_t, state.trace_interval, state.n_trace, state.next_trace
+        )
+        state.area_system = state.area_queue + area_service
+        state.in_system = state.in_queue + in_service
+        state.time = self.now
+
+        with section('logging'):
+            if self.stream:
+                self.stream.add_arrays(waiting_times[:self.n_waiting_times], queue_lengths[:self.n_queue_lengths])
+            if self.customers is not None:
+                customers = self.customers[:self.n_queue_lengths]
+                customers['arrival'] = times[:self.n_queue_lengths]
+                customers['wait'] = waits[:self.n_queue_lengths]
+                customers['service'] = service_times[:self.n_queue_lengths]
+                customers['queue_length'] = queue_lengths[:self.n_queue_lengths]
+
+
+    def run_vectorized(self):
+        '''
+        Runs a FIFO simulation without events: all inter-arrival and
+        service times are drawn up front and waiting times follow from
+        the Lindley (c=1) or Kiefer-Wolfowitz (c>1) recursion.
+        Uses the same streams as the other engines, so a seed gives
+        the same log up to floating-point rounding.
+        '''
+
+        section = self.profiler.section if self.profiler else lambda name: nullcontext()
+
+        with section('variates'):
+            arrival_times, service_times = draw_fifo_arrays(
+                self.arrival_rng, self.service_rng, self.B, self.mean_arrival_rate, self.mean_service_rate, self.max_customers, self.streams
+            )
+        start_times = fifo_start_times(arrival_times, service_times, self.n_servers)
+
+        # Only log events before max_runtime (both arrays are sorted):
+        with section('logging'):
+            self.n_queue_lengths = np.searchsorted(arrival_times, self.max_runtime)
+            self.n_waiting_times = np.searchsorted(start_times, self.max_runtime)
+            waiting_times = (start_times - arrival_times)[:self.n_waiting_times]
+            queue_lengths = fifo_queue_lengths(arrival_times, start_times)[:self.n_queue_lengths]
+            if self.stream: self.stream.add_arrays(waiting_times, queue_lengths)
+            else: self.waiting_times, self.queue_lengths = waiting_times, queue_lengths
+            if self.customers is not None:
+                customers = self.customers[:self.n_queue_lengths]
+                customers['arrival'] = arrival_times[:self.n_queue_lengths]
+                customers['service'] = service_times[:self.n_queue_lengths]
+                customers['queue_length'] = queue_lengths
+                customers['wait'][:self.n_waiting_times] = waiting_times
+
+        # Time-weighted state from the sorted event times (as in the event loop,
+        # the run ends at the last departure or at max_runtime):
+        departure_times = np.sort(start_times + service_times)
+        self.now = min(self.max_runtime, departure_times[-1])
+        state = self.state
+        state.area_system = step_area(arrival_times, departure_times, self.now)
+        state.area_queue = step_area(arrival_times, start_times, self.now)
+        state.time = self.now
+        state.in_queue = self.n_queue_lengths - self.n_waiting_times
+        state.in_system = self.n_queue_lengths - np.searchsorted(departure_times, self.now, side='right')
+
+        n_trace = min(state.t.size, np.ceil(self.now / state.trace_interval).astype(int))
+        state.t[:n_trace] = np.arange(n_trace) * state.trace_interval
+        state.N_t[:n_trace] = (
+            np.searchsorted(arrival_times, state.t[:n_trace], side='right')
+            - np.searchsorted(departure_times, state.t[:n_trace], side='right')
+        )
+        state.n_trace = n_trace
+        state.next_trace = n_trace * state.trace_interval if n_trace < state.t.size else np.inf
+
+
     def get_A_t(self):
         '''
         Returns arrivals and time t.
         '''
-        t = self.env.now
+        t = self.now
         return t, self.mean_arrival_rate
 
     def get_log(self):
         '''
         Returns `waiting_times` and `queue_lengths`.
         '''
-        return self.waiting_times, self.queue_lengths
+        return self.waiting_times[:self.n_waiting_times], self.queue_lengths[:self.n_queue_lengths]
+
+    def get_time_averages(self):
+        '''
+        Returns the time-average number of customers in system and in queue.
+        '''
+        return self.state.mean_in_system, self.state.mean_in_queue
+
+    def get_controls(self):
+        '''
+        Returns control variates with known expectations (see `QueueMetrics.get_control_expectations`):
+        the mean service time of the customers that arrived. Their number only depends
+        on the arrival stream, so this mean is unbiased. Requires shared `streams`.
+        '''
+        n = max(self.n_queue_lengths, 1)
+        _, service_times = self.streams.variates(self.mean_arrival_rate, self.B, self.mean_service_rate, n)
+        return (service_times.mean(),)
+
+    def get_profile(self):
+        '''
+        Returns the profile of a run with `profile=True`: a dict with the engine,
+        the number of events by type, the wall-clock and simulated time, the wall
+        time per simulated time unit, events per second, the wall-clock time per
+        section (variates, logging, scheduling and instrumentation overhead) and
+        samples of (simulated time, wall time, queue length) every
+        `profiling.SAMPLE_EVERY` arrivals (none for the vectorized and jit engines).
+        '''
+        if self.profiler is None:
+            raise ValueError("The simulation was not run with profile=True")
+        return self.profiler.report()
+
+    def get_summary(self):
+        '''
+        Returns (average waiting time, average queue length, n_wait, n_queue),
+        from the raw logs or, if these are disabled, the streaming statistics.
+        '''
+        if self.stream:
+            waiting_times, queue_lengths = self.stream.waiting_times, self.stream.queue_lengths
+            return (
+                waiting_times.mean if waiting_times.n else np.NaN, queue_lengths.mean if queue_lengths.n else np.NaN,
+                self.n_waiting_times, self.n_queue_lengths
+            )
+        waiting_times, queue_lengths = self.get_log()
+        return np.mean(waiting_times), np.mean(queue_lengths), waiting_times.size, queue_lengths.size
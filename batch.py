@@ -0,0 +1,84 @@
+'''
+Runs many `main.py` configurations in one warm interpreter, instead of
+starting a new process (and importing NumPy, SimPy, ...) per configuration.
+
+Configurations are read one per line from files or, without files, from
+stdin. A line is either a `main.py` command line or a JSON object with the
+same argument names (`queue_system` and `run_time` are required):
+
+    MD1 100000 -c 10000 -l 0.8 -m 2 -n 250 --save
+    {"queue_system": "MD1", "run_time": 100000, "customers": 10000, "arrival_rate": 0.8, "service_rate": 2, "n": 250, "save": true}
+
+Empty lines and lines starting with '#' are skipped. Invalid or failing
+configurations are reported and skipped; the exit status is 1 if any
+configuration failed.
+For example, the loop of `bash_scripts/MD1_sims.sh` becomes
+
+    for l in 0.1 0.4 0.8; do echo "MD1 100000 -c 10000 -l $l -m 2 -n 250 --save"; done | python3 batch.py
+'''
+
+import argparse
+import fileinput
+import shlex
+import json
+import sys
+
+from main import build_parser, run_args
+
+
+def parse_config(parser, line):
+    """
+    Returns the parsed arguments of a configuration line (command line or JSON object).
+    Raises ValueError for invalid lines.
+    """
+    if line.startswith("{"):
+        config = json.loads(line)
+        if "queue_system" not in config or "run_time" not in config:
+            raise ValueError("JSON configurations need 'queue_system' and 'run_time'")
+        args = parser.parse_args([str(config.pop("queue_system")), str(config.pop("run_time"))])
+        for key, value in config.items():
+            if not hasattr(args, key):
+                raise ValueError(f"Unknown argument '{key}'")
+            setattr(args, key, value)
+        return args
+
+    try:
+        return parser.parse_args(shlex.split(line))
+    except SystemExit:
+        raise ValueError("Invalid command line (see usage above)")
+
+
+def serve(lines):
+    """
+    Runs the configuration on each line of `lines`. Returns the number of failed configurations.
+    """
+    parser = build_parser()
+    failed = 0
+
+    for i, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        print(f"=== [{i}] {line}", flush=True)
+        try:
+            error = run_args(parse_config(parser, line))
+        except Exception as e:
+            # one failed configuration (invalid line, full disk, out of memory, ...) must not stop the batch
+            print(f"{type(e).__name__}: {e}")
+            error = True
+        failed += bool(error)
+        print("", flush=True)
+
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run many main.py configurations in one process")
+    parser.add_argument("files", nargs="*", help="files with one configuration per line (default: stdin)")
+    args = parser.parse_args()
+
+    failed = serve(fileinput.input(args.files))
+    if failed:
+        print(f"{failed} configuration(s) failed")
+    sys.exit(1 if failed else 0)
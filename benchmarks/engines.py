@@ -0,0 +1,40 @@
+'''
+Compares the SimPy and native engines on the M/M/4 workloads of
+`bash_scripts/MM4_sims.sh` (mu = 2, 10,000 customers per run).
+
+Run from the repository root:
+    python3 -m benchmarks.engines
+'''
+
+import time
+import numpy as np
+
+from Queue import QueueSimulation
+
+
+def time_engine(engine, arrival_rate, repeats=5):
+    '''
+    Returns the mean wall-clock time per run and the mean waiting time
+    over `repeats` seeds for the given `engine`.
+    '''
+
+    runtimes, waits = np.zeros(repeats), np.zeros(repeats)
+    for seed in range(repeats):
+        simulation = QueueSimulation(4, 'FIFO', 2, arrival_rate, 10_000, 100_000, seed=seed, B='M', engine=engine)
+        start = time.perf_counter()
+        simulation.run()
+        runtimes[seed] = time.perf_counter() - start
+        waits[seed] = simulation.get_log()[0].mean()
+
+    return runtimes.mean(), waits.mean()
+
+
+if __name__ == '__main__':
+
+    lamb_values = [0.4, 1.6, 3.2, 4.8, 6.4, 7.2, 7.6, 7.92]
+
+    print(f"{'lambda':>7} {'simpy (s)':>10} {'native (s)':>11} {'speed-up':>9} {'same mean wait':>15}")
+    for lamb in lamb_values:
+        t_simpy, w_simpy = time_engine('simpy', lamb)
+        t_native, w_native = time_engine('native', lamb)
+        print(f"{lamb:>7} {t_simpy:>10.3f} {t_native:>11.4f} {t_simpy / t_native:>8.1f}x {str(np.isclose(w_simpy, w_native)):>15}")
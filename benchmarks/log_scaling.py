@@ -0,0 +1,52 @@
+'''
+Benchmarks how the runtime of a single simulation grows with the
+number of customers. With preallocated logs the time per customer
+should stay (roughly) constant, i.e. total runtime grows linearly.
+
+Run from the repository root:
+    python3 -m benchmarks.log_scaling
+'''
+
+import time
+import numpy as np
+
+from Queue import QueueSimulation
+
+
+def time_run(max_customers, repeats=3):
+    '''
+    Returns the best wall-clock time (in seconds) out of `repeats` runs
+    of an M/M/1 simulation with `max_customers` customers.
+    '''
+
+    best = np.inf
+    for seed in range(repeats):
+        simulation = QueueSimulation(
+            n_servers= 1,
+            discipline= 'FIFO',
+            mean_service_rate= 1,
+            mean_arrival_rate= 0.9,
+            max_customers= max_customers,
+            max_runtime= np.inf,  # only stop on max_customers
+            seed= seed,
+            B= 'M'
+        )
+        start = time.perf_counter()
+        simulation.run()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+if __name__ == '__main__':
+
+    customers = [1_000, 10_000, 100_000]
+    timings = [time_run(n) for n in customers]
+
+    print(f"{'customers':>10} {'runtime (s)':>12} {'us/customer':>12}")
+    for n, t in zip(customers, timings):
+        print(f"{n:>10} {t:>12.3f} {1e6 * t / n:>12.2f}")
+
+    # Linear scaling means the cost per customer does not grow with n:
+    growth = (timings[-1] / customers[-1]) / (timings[0] / customers[0])
+    print(f"\nCost per customer grew by a factor {growth:.2f} over a {customers[-1] // customers[0]}x increase in customers.")
@@ -0,0 +1,78 @@
+'''
+Compares the `HeapQueue` put-queue of `HeapPriorityResource` with the sorted
+list of `simpy.PriorityResource`, at growing queue depths:
+
+1. the queue alone, held at a fixed depth while requests are added and served;
+2. SimPy M/M/1 SJF runs at increasing rho; beyond rho = 1 the queue keeps
+   growing, which gives queues thousands deep.
+
+Run from the repository root:
+    python3 -m benchmarks.sjf_queue
+'''
+
+import time
+import random
+import simpy
+from unittest import mock
+from simpy.resources.resource import SortedQueue
+
+import simpy_resources
+from Queue import QueueSimulation, HeapQueue
+from simpy_resources import HeapPriorityResource
+
+
+class Request:
+
+    '''
+    Stand-in for a SimPy request, ordered on `key`.
+    '''
+
+    def __init__(self, key):
+        self.key = key
+
+
+def time_queue(queue, depth, operations=20_000):
+    '''
+    Returns the mean time per append + pop(0) on `queue` held at `depth` items.
+    '''
+
+    rng = random.Random(depth)
+    for _ in range(depth):
+        queue.append(Request((rng.random(), 0.0, False)))
+
+    requests = [Request((rng.random(), 0.0, False)) for _ in range(operations)]
+    start = time.perf_counter()
+    for request in requests:
+        queue.append(request)
+        queue.pop(0)
+    return (time.perf_counter() - start) / operations
+
+
+def time_simulation(arrival_rate, resource, customers=20_000):
+    '''
+    Returns the wall-clock time and mean queue length of a SimPy M/M/1 SJF run with `resource`.
+    '''
+
+    simulation = QueueSimulation(1, 'SJF', 1, arrival_rate, customers, 10**9, seed=0, engine='simpy')
+    with mock.patch.object(simpy_resources, 'HeapPriorityResource', resource):
+        start = time.perf_counter()
+        simulation.run()
+        runtime = time.perf_counter() - start
+    return runtime, simulation.get_log()[1].mean()
+
+
+if __name__ == '__main__':
+
+    print("Put-queue alone, time per append + pop")
+    print(f"{'depth':>7} {'sorted list (us)':>17} {'heap (us)':>10} {'speed-up':>9}")
+    for depth in [10, 100, 1_000, 10_000]:
+        t_sorted = time_queue(SortedQueue(), depth)
+        t_heap = time_queue(HeapQueue(key=lambda request: request.key), depth)
+        print(f"{depth:>7} {t_sorted * 1e6:>17.2f} {t_heap * 1e6:>10.2f} {t_sorted / t_heap:>8.1f}x")
+
+    print("\nSimPy M/M/1 SJF, 20,000 customers")
+    print(f"{'rho':>5} {'mean queue':>11} {'PriorityResource (s)':>21} {'HeapPriorityResource (s)':>25} {'speed-up':>9}")
+    for rho in [0.5, 0.9, 0.99, 1.05, 1.2, 1.5]:
+        t_sorted, queue_length = time_simulation(rho, simpy.PriorityResource)
+        t_heap, _ = time_simulation(rho, HeapPriorityResource)
+        print(f"{rho:>5} {queue_length:>11.1f} {t_sorted:>21.3f} {t_heap:>25.3f} {t_sorted / t_heap:>8.1f}x")
@@ -0,0 +1,191 @@
+'''
+Benchmark suite for `QueueSimulation.run()` with regression tracking.
+
+Times representative configurations (MM1/MM4/MD2/MH4, FIFO/SJF, rho from
+0.05 to 0.99, 1e3 to 1e6 customers) and reports events/sec, replications/sec
+and peak memory. Results are written as JSON and can be compared against a
+stored baseline: configurations whose events/sec dropped by more than the
+tolerance are flagged, and the exit status is non-zero if the geometric mean
+over all configurations dropped by more than the tolerance (single short
+configurations are much noisier than the mean).
+
+Run from the repository root:
+    python3 -m benchmarks.suite                       # quick set, up to 1e5 customers
+    python3 -m benchmarks.suite --full -e native simpy
+    python3 -m benchmarks.suite --save-baseline       # store results as the baseline
+    python3 -m benchmarks.suite --baseline benchmarks/results/baseline.json
+
+Baselines are machine specific, so compare only results from the same machine.
+'''
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+from itertools import product
+import numpy as np
+
+from Queue import QueueSimulation, service_time_moments
+from cache import code_version
+
+RESULTS_DIR = "./benchmarks/results/"
+BASELINE = os.path.join(RESULTS_DIR, "baseline.json")
+
+QUEUE_SYSTEMS = ["MM1", "MM4", "MD2", "MH4"]
+DISCIPLINES = ["FIFO", "SJF"]
+RHOS = [0.05, 0.5, 0.9, 0.99]
+CUSTOMERS = [1_000, 10_000, 100_000]
+FULL_CUSTOMERS = CUSTOMERS + [1_000_000]
+
+
+def configurations(engines, customers):
+    '''
+    Returns the benchmark configurations as dicts. The arrival rate gives the
+    load rho on the actual mean service time (for 'H' this is not 1 / mu).
+    '''
+
+    configs = []
+    for queue_system, discipline, rho, max_customers, engine in product(QUEUE_SYSTEMS, DISCIPLINES, RHOS, customers, engines):
+        if engine == "vectorized" and discipline != "FIFO":
+            continue
+        c = int(queue_system[2])
+        mean, _ = service_time_moments(queue_system[1], 1)
+        configs.append({
+            "queue_system": queue_system, "discipline": discipline, "rho": rho, "customers": max_customers,
+            "engine": engine, "arrival_rate": rho * c / mean,
+        })
+    return configs
+
+
+def make_simulation(config, seed):
+    return QueueSimulation(
+        int(config["queue_system"][2]), config["discipline"], 1, config["arrival_rate"], config["customers"],
+        np.inf, seed=seed, B=config["queue_system"][1], engine=config["engine"]
+    )
+
+
+def run_benchmark(config, min_time=0.5, max_repeats=50):
+    '''
+    Description
+    -----------
+    Times `config` on different seeds until `min_time` seconds or `max_repeats`
+    runs have passed (at least one), then measures peak memory in a separate run
+    (tracemalloc slows the run down, so it is not timed). The memory includes the
+    preallocated logs.
+
+    Returns
+    -------
+    dict with the best runtime, events/sec (arrivals, service starts and
+    departures) and replications/sec, and the peak traced memory in MB.
+    The best of several runs is the least sensitive to other load on the machine.
+    '''
+
+    runtimes, events = [], []
+    while len(runtimes) < max_repeats and (not runtimes or sum(runtimes) < min_time):
+        simulation = make_simulation(config, seed=len(runtimes))
+        start = time.perf_counter()
+        simulation.run()
+        runtimes.append(time.perf_counter() - start)
+        # every customer that started service departs, the run only stops on customers
+        events.append(simulation.n_queue_lengths + 2 * simulation.n_waiting_times)
+
+    tracemalloc.start()
+    simulation = make_simulation(config, seed=0)
+    simulation.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    runtime = min(runtimes)
+    return {
+        "runtime_s": runtime,
+        "events_per_s": float(np.max(np.array(events) / np.array(runtimes))),
+        "replications_per_s": 1 / runtime,
+        "peak_memory_mb": peak / 2**20,
+        "repeats": len(runtimes),
+    }
+
+
+def config_key(config):
+    return f'{config["queue_system"]}-{config["discipline"]}-rho{config["rho"]}-n{config["customers"]}-{config["engine"]}'
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Returns the keys of configurations whose events/sec fell more than
+    `tolerance` (a fraction) below the baseline, with the relative change,
+    and the change of the geometric mean over all common configurations.
+    '''
+
+    reference = {config_key(result): result for result in baseline["results"]}
+    regressions, ratios = [], []
+    for result in results:
+        key = config_key(result)
+        if key in reference:
+            ratio = result["events_per_s"] / reference[key]["events_per_s"]
+            result["change"] = ratio - 1
+            ratios.append(ratio)
+            if ratio - 1 < -tolerance:
+                regressions.append((key, ratio - 1))
+    overall = float(np.exp(np.mean(np.log(ratios)))) - 1 if ratios else 0.0
+    return regressions, overall
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark QueueSimulation.run() and track regressions")
+
+    parser.add_argument("-e", "--engines", nargs="+", default=["native"], help="engines to benchmark (simpy, native, vectorized)")
+    parser.add_argument("--full", action="store_true", help="include runs of 1e6 customers")
+    parser.add_argument("-o", "--output", help="results file (default: timestamped in %s)" % RESULTS_DIR)
+    parser.add_argument("--baseline", nargs="?", const=BASELINE, help="compare with a baseline results file (default %(const)s)")
+    parser.add_argument("--save-baseline", dest="save_baseline", action="store_true", help="also store the results as %s" % BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative drop in events/sec flagged as regression")
+    parser.add_argument("--min-time", dest="min_time", type=float, default=0.5, help="minimum time spent per configuration (s)")
+
+    args = parser.parse_args()
+
+    configs = configurations(args.engines, FULL_CUSTOMERS if args.full else CUSTOMERS)
+    results = []
+
+    print(f"{'configuration':>36} {'events/s':>11} {'reps/s':>9} {'peak MB':>8}")
+    for config in configs:
+        result = {**config, **run_benchmark(config, args.min_time)}
+        results.append(result)
+        print(f"{config_key(config):>36} {result['events_per_s']:>11.0f} {result['replications_per_s']:>9.2f} {result['peak_memory_mb']:>8.1f}")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "code_version": code_version(),
+        "machine": {"platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count()},
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "results": results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions, overall = compare(results, baseline, args.tolerance)
+        report["baseline"] = {"path": args.baseline, "code_version": baseline["code_version"], "tolerance": args.tolerance, "overall_change": overall}
+        print(f"\nCompared with {args.baseline} (code version {baseline['code_version']}):")
+        for key, change in regressions:
+            print(f"REGRESSION {key}: {change:+.1%} events/s")
+        if not regressions:
+            print(f"No regressions beyond {args.tolerance:.0%}")
+        print(f"Overall (geometric mean): {overall:+.1%} events/s")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, f"results_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.save_baseline:
+        with open(BASELINE, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {BASELINE}")
+
+    sys.exit(1 if args.baseline and overall < -args.tolerance else 0)
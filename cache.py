@@ -0,0 +1,206 @@
+'''
+Content-addressed cache of per-replication simulation summaries.
+
+Results are keyed by a hash of the full `QueueSimulation` parameter set
+(including the seed) and the version of the simulation code, so a
+replication is only ever simulated once per code version. Lookups go
+through an in-memory LRU layer first and an on-disk store second; the
+disk store is capped in size and evicts least recently used entries.
+'''
+
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+
+CACHE_DIR = "./data/cache/"
+
+# Modules the simulation results depend on, hashed in this order:
+SIMULATION_MODULES = ("Queue.py", "streaming.py", "profiling.py", "kernels.py", "simpy_resources.py", "erlang.py")
+
+
+@lru_cache(maxsize=None)
+def code_version():
+    """
+    Returns a short hash of the simulation code (`SIMULATION_MODULES`).
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for name in SIMULATION_MODULES:
+        digest.update(name.encode())
+        with open(os.path.join(directory, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def simulation_params(n_servers, discipline, mean_service_rate, mean_arrival_rate, max_customers, max_runtime, seed, B, engine, streams=None, streaming=False):
+    """
+    Returns the `QueueSimulation` parameters as a dict with normalized types,
+    so that f.e. a service rate of 1 and 1.0 map to the same key.
+    Shared random `streams` ("crn" or "antithetic") and `streaming` statistics
+    are only part of the key if set.
+    """
+    params = {
+        "n_servers": int(n_servers),
+        "discipline": discipline,
+        "mean_service_rate": float(mean_service_rate),
+        "mean_arrival_rate": float(mean_arrival_rate),
+        "max_customers": int(max_customers),
+        "max_runtime": float(max_runtime),
+        "seed": int(seed),
+        "B": B,
+        "engine": engine,
+    }
+    if streams:
+        params["streams"] = streams
+    if streaming:
+        params["streaming"] = True
+    return params
+
+
+class ResultCache:
+
+    '''
+    Handles storage and lookup of simulation summaries.
+    '''
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=256 * 2**20, memory_items=4096):
+        '''
+        Description
+        -----------
+        Initializes the cache and measures the current size of the disk store.
+
+        Parameters
+        ----------
+        directory : `str`
+            Directory of the on-disk store.
+        max_bytes : `int`
+            Size cap of the on-disk store, in bytes.
+        memory_items : `int`
+            Number of entries kept in the in-memory layer.
+        '''
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.memory = OrderedDict()
+        self.hits, self.misses = 0, 0
+
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for _, size, _ in self.entries())
+
+
+    def key(self, params):
+        '''
+        Returns the hash of a parameter dict (see `simulation_params`) and the code version.
+        '''
+        content = json.dumps({"params": params, "code_version": code_version()}, sort_keys=True)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+
+    def path(self, key):
+        '''
+        Returns the file of `key`, sharded into subdirectories on its first two characters.
+        '''
+        return os.path.join(self.directory, key[:2], key[2:] + ".json")
+
+
+    def entries(self):
+        '''
+        Yields (path, size, last access time) of all entries in the disk store.
+        '''
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    yield path, stat.st_size, stat.st_mtime
+
+
+    def remember(self, key, value):
+        '''
+        Stores `value` in the in-memory layer, dropping the least recently used entry if full.
+        '''
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+
+    def get(self, params):
+        '''
+        Returns the cached summary for `params`, or None if absent.
+        '''
+
+        key = self.key(params)
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                value = tuple(json.load(f)["summary"])
+            os.utime(path)  # mark as recently used
+        except (FileNotFoundError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+        self.remember(key, value)
+        self.hits += 1
+        return value
+
+
+    def put(self, params, value):
+        '''
+        Stores the summary `value` for `params` in memory and on disk.
+        '''
+
+        key = self.key(params)
+        value = tuple(value)
+        self.remember(key, value)
+
+        # Write atomically, other processes may read the same entry:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        content = json.dumps({"params": params, "code_version": code_version(), "summary": value})
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        try:
+            replaced = os.path.getsize(path)  # an existing entry is overwritten, not added
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, path)
+
+        self.size += len(content) - replaced
+        if self.size > self.max_bytes:
+            self.evict()
+
+
+    def evict(self):
+        '''
+        Removes least recently used entries until the disk store is below 90% of its cap.
+        '''
+
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        self.size = sum(size for _, size, _ in entries)
+
+        for path, size, _ in entries:
+            if self.size <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # evicted by another process
+            self.size -= size
+
+
+@lru_cache(maxsize=None)
+def get_cache(directory=CACHE_DIR):
+    """
+    Returns the cache of `directory`, shared by all calls within one process.
+    """
+    return ResultCache(directory)
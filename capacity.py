@@ -0,0 +1,289 @@
+'''
+Capacity planning: finds the minimum number of servers, or the maximum arrival
+rate, for which a waiting-time quantile (f.e. P95) meets a target (the SLA).
+
+The analytic waiting-time quantile (`erlang.waiting_time_quantile`, exact
+for M/M/c FIFO) gives a first answer. Simulation then only checks the
+configurations around it: the search brackets the boundary next to the
+analytic answer and bisects it (over c, or over lambda down to a relative
+tolerance). Every checked configuration runs replications in batches until
+the confidence interval of the mean replication quantile lies on one side
+of the SLA, or the maximum number of replications is reached. Replication
+i of every configuration uses common random numbers of seed i, so the
+decisions of neighbouring configurations are consistent.
+
+Give the queue system with 'c' as the number of servers to search the
+minimum number of servers for arrival rate -l, or with a number of servers
+to search the maximum arrival rate:
+
+    python3 capacity.py MMc 2 -l 3.6 -m 1             # min c with P95 wait <= 2 at lambda = 3.6
+    python3 capacity.py MD4 2 -m 1 -d SJF -w 8        # max lambda with P95 wait <= 2 with 4 servers
+'''
+
+import math
+import argparse
+import multiprocessing
+from contextlib import nullcontext
+from functools import partial
+import numpy as np
+
+from Queue import QueueSimulation, CommonRandomNumbers, SERVICE_DISTRIBUTIONS, service_time_moments
+from estimators import mean_ci
+from helpers import utilization
+from erlang import waiting_time_quantile
+
+
+def replication_quantile(seed, n_servers, discipline, service_rate, arrival_rate, max_customers, max_runtime, B, engine, quantile):
+    '''
+    Runs one replication on the common random numbers of `seed` and returns its waiting time `quantile`.
+    '''
+    simulation = QueueSimulation(
+        n_servers, discipline, service_rate, arrival_rate, max_customers, max_runtime, B=B, engine=engine,
+        trace_points=0, streams=CommonRandomNumbers(seed, max_customers)
+    )
+    simulation.run()
+    waiting_times, _ = simulation.get_log()
+    return np.quantile(waiting_times, quantile)
+
+
+class CapacitySearch:
+
+    '''
+    Handles the search for the capacity that meets a waiting-time SLA.
+    '''
+
+    def __init__(self, B, service_rate, sla, quantile=0.95, discipline="FIFO", max_customers=10**5, max_runtime=np.inf, engine="native",
+                 min_replications=5, max_replications=50, confidence=0.95, pool=None):
+        '''
+        Description
+        -----------
+        Initializes the search parameters.
+
+        Parameters
+        ----------
+        B : `str`
+            Service time distribution ('M', 'D' or 'H').
+        service_rate : `float`
+            Mean service rate (mu) per server.
+        sla : `float`
+            Target of the waiting-time quantile.
+        quantile : `float`
+            Waiting-time quantile held to the SLA, f.e. 0.95 for P95.
+        discipline, max_customers, max_runtime, engine
+            As in `QueueSimulation`, per replication.
+        min_replications : `int`
+            Replications per batch.
+        max_replications : `int`
+            Replications after which a configuration is decided on the mean alone.
+        confidence : `float`
+            Confidence level of the interval compared with the SLA.
+        pool : `multiprocessing.Pool`
+            Runs the replications of a batch in parallel, if given.
+        '''
+
+        if B not in SERVICE_DISTRIBUTIONS:
+            raise ValueError(f"Unknown service time distribution '{B}', expected one of {SERVICE_DISTRIBUTIONS}")
+
+        self.B = B
+        self.service_rate = service_rate
+        self.sla = sla
+        self.quantile = quantile
+        self.discipline = discipline
+        self.max_customers = max_customers
+        self.max_runtime = max_runtime
+        self.engine = engine
+        self.min_replications = min_replications
+        self.max_replications = max_replications
+        self.confidence = confidence
+        self.pool = pool
+        self.mean_service_time, self.scv = service_time_moments(B, service_rate)
+
+        # (n_servers, arrival_rate, mean quantile, CI half-width, replications, meets SLA) per checked configuration
+        self.evaluations = []
+
+
+    def analytic_quantile(self, n_servers, arrival_rate):
+        '''
+        Returns the analytic (FIFO) waiting-time quantile, infinite if unstable.
+        '''
+        return waiting_time_quantile(self.quantile, arrival_rate, self.mean_service_time, self.scv, n_servers)
+
+    def analytic_min_servers(self, arrival_rate):
+        '''
+        Returns the minimum number of servers that meets the SLA analytically.
+        '''
+        n_servers = math.floor(arrival_rate * self.mean_service_time) + 1
+        while self.analytic_quantile(n_servers, arrival_rate) > self.sla:
+            n_servers += 1
+        return n_servers
+
+    def analytic_max_arrival_rate(self, n_servers, tolerance=1e-6):
+        '''
+        Returns the maximum arrival rate that meets the SLA analytically, by bisection.
+        '''
+        low, high = 0.0, n_servers / self.mean_service_time
+        while high - low > tolerance * high:
+            middle = (low + high) / 2
+            if self.analytic_quantile(n_servers, middle) <= self.sla:
+                low = middle
+            else:
+                high = middle
+        return low
+
+
+    def meets_sla(self, n_servers, arrival_rate):
+        '''
+        Description
+        -----------
+        Simulates `n_servers` at `arrival_rate` in batches of replications until
+        the confidence interval of the mean replication quantile lies below or above
+        the SLA, or `max_replications` have run. Unstable configurations never meet
+        the SLA and are not simulated.
+        '''
+
+        if utilization(self.B, arrival_rate, self.service_rate, n_servers) >= 1:
+            return False
+
+        task = partial(
+            replication_quantile, n_servers=n_servers, discipline=self.discipline, service_rate=self.service_rate,
+            arrival_rate=arrival_rate, max_customers=self.max_customers, max_runtime=self.max_runtime, B=self.B,
+            engine=self.engine, quantile=self.quantile
+        )
+        quantiles = []
+        while len(quantiles) < self.max_replications:
+            seeds = range(len(quantiles), min(len(quantiles) + self.min_replications, self.max_replications))
+            quantiles.extend(self.pool.map(task, seeds) if self.pool else map(task, seeds))
+            mean, half_width = mean_ci(quantiles, self.confidence)
+            if abs(mean - self.sla) > half_width:
+                break
+
+        meets = bool(mean <= self.sla)
+        self.evaluations.append((n_servers, arrival_rate, mean, half_width, len(quantiles), meets))
+        return meets
+
+
+    def min_servers(self, arrival_rate):
+        '''
+        Returns the minimum number of servers that meets the SLA at `arrival_rate`.
+        Starting from the analytic answer, steps of doubling size find a number of
+        servers that does not meet the SLA and one that does, then bisection.
+        '''
+
+        n_servers = self.analytic_min_servers(arrival_rate)
+        step = 1
+        if self.meets_sla(n_servers, arrival_rate):
+            low, high = n_servers - step, n_servers
+            while low > 0 and self.meets_sla(low, arrival_rate):
+                step *= 2
+                low, high = max(0, low - step), low
+        else:
+            low, high = n_servers, n_servers + step
+            while not self.meets_sla(high, arrival_rate):
+                step *= 2
+                low, high = high, high + step
+
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self.meets_sla(middle, arrival_rate):
+                high = middle
+            else:
+                low = middle
+        return high
+
+
+    def max_arrival_rate(self, n_servers, tolerance=0.01):
+        '''
+        Returns the maximum arrival rate that meets the SLA with `n_servers`, within a
+        relative `tolerance`. Starting from the analytic answer, steps of doubling size
+        find an arrival rate that meets the SLA and one that does not, then bisection.
+        '''
+
+        arrival_rate = self.analytic_max_arrival_rate(n_servers)
+        step = tolerance * arrival_rate
+        if self.meets_sla(n_servers, arrival_rate):
+            low, high = arrival_rate, arrival_rate + step
+            while self.meets_sla(n_servers, high):
+                step *= 2
+                low, high = high, high + step
+        else:
+            low, high = arrival_rate - step, arrival_rate
+            while low > 0 and not self.meets_sla(n_servers, low):
+                step *= 2
+                low, high = max(0.0, low - step), low
+
+        while low > 0 and high - low > tolerance * low:
+            middle = (low + high) / 2
+            if self.meets_sla(n_servers, middle):
+                low = middle
+            else:
+                high = middle
+        return low
+
+
+    def format_evaluations(self):
+        '''
+        Returns a printable table of the simulated configurations.
+        '''
+        lines = [f"{'servers':>8} {'lambda':>10} {f'P{self.quantile * 100:g} wait':>12} {'CI +/-':>9} {'reps':>5}  SLA"]
+        for n_servers, arrival_rate, mean, half_width, replications, meets in self.evaluations:
+            lines.append(f"{n_servers:>8} {arrival_rate:>10.4f} {mean:>12.3f} {half_width:>9.3f} {replications:>5}  {'met' if meets else 'missed'}")
+        return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Find the minimum servers or maximum arrival rate meeting a waiting-time quantile SLA")
+
+    parser.add_argument("queue_system", help="queueing system in kendall notation, with c as the number of servers to search it, f.e. MMc or MD4")
+    parser.add_argument("sla", help="target of the waiting-time quantile", type=float)
+    parser.add_argument("-q", "--quantile", help="waiting-time quantile held to the SLA", default=0.95, type=float)
+    parser.add_argument("-l", "--arrival_rate", help="mean arrival rate (lambda), when searching the number of servers", type=float)
+    parser.add_argument("-m", "--service_rate", help="mean service rate (mu)", default=1, type=float)
+    parser.add_argument("-d", "--discipline", help="how to select from queue (FIFO or SJF)", default="FIFO")
+    parser.add_argument("-c", "--customers", help="max customers arriving in one simulation", default=10**5, type=int)
+    parser.add_argument("-t", "--run_time", help="max run_time used per simulation", default=np.inf, type=float)
+    parser.add_argument("-e", "--engine", help="simulation engine (simpy, native, vectorized or jit)", default="native")
+    parser.add_argument("-w", "--workers", help="number of worker processes running simulations in parallel", default=1, type=int)
+    parser.add_argument("--min-replications", dest="min_replications", help="replications per batch", default=5, type=int)
+    parser.add_argument("--max-replications", dest="max_replications", help="replications per configuration at most", default=50, type=int)
+    parser.add_argument("--confidence", type=float, default=0.95, help="confidence level of the SLA decisions")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="relative tolerance of the maximum arrival rate")
+
+    args = parser.parse_args()
+
+    search_servers = args.queue_system[-1:] == "c"
+    if len(args.queue_system) != 3 or args.queue_system[0] != "M" or args.queue_system[1] not in SERVICE_DISTRIBUTIONS:
+        parser.error("Incorrect queue system format. Correct examples: MMc, MD4")
+    elif not search_servers and not args.queue_system[2].isdigit():
+        parser.error("Number of servers must be a digit, or c to search it")
+    elif search_servers and args.arrival_rate is None:
+        parser.error("Searching the number of servers needs an arrival rate (-l)")
+    elif args.sla <= 0:
+        parser.error("The SLA must be positive")
+    elif not 0 < args.quantile < 1 or not 0 < args.confidence < 1:
+        parser.error("Quantile and confidence level must be between zero and one")
+    elif args.discipline not in ["FIFO", "SJF"] or (args.engine == "vectorized" and args.discipline != "FIFO"):
+        parser.error("Queue discipline must be FIFO or SJF (FIFO only for the vectorized engine)")
+    elif args.min_replications < 2 or args.max_replications < args.min_replications:
+        parser.error("Replications per batch must be at least two and at most --max-replications")
+
+    with multiprocessing.Pool(args.workers) if args.workers > 1 else nullcontext() as pool:
+        search = CapacitySearch(
+            args.queue_system[1], args.service_rate, args.sla, args.quantile, args.discipline, args.customers, args.run_time,
+            args.engine, args.min_replications, args.max_replications, args.confidence, pool
+        )
+
+        if search_servers:
+            print(f"Analytic minimum number of servers: {search.analytic_min_servers(args.arrival_rate)}")
+            answer = search.min_servers(args.arrival_rate)
+        else:
+            n_servers = int(args.queue_system[2])
+            print(f"Analytic maximum arrival rate: {search.analytic_max_arrival_rate(n_servers):.4f}")
+            answer = search.max_arrival_rate(n_servers, args.tolerance)
+
+    print(search.format_evaluations())
+    n_runs = sum(evaluation[4] for evaluation in search.evaluations)
+    print(f"\n{len(search.evaluations)} configurations simulated in {n_runs} replications")
+    if search_servers:
+        print(f"Minimum number of servers: {answer}")
+    else:
+        print(f"Maximum arrival rate: {answer:.4f}")
@@ -0,0 +1,162 @@
+'''
+Analytic M/M/c results based on the Erlang-B recursion
+
+    B(0, a) = 1,    B(k, a) = a B(k-1, a) / (k + a B(k-1, a)),
+
+which, unlike sums of factorials and raw powers, neither overflows nor
+loses precision for hundreds of servers. Erlang-C and the other measures
+follow from B. All functions accept scalars or (broadcastable) arrays of
+arrival rates, service rates and numbers of servers; scalar results are
+memoized, so repeated evaluation per replication or sweep point is free.
+
+For general service times (M/G/c), `mgc_metrics` scales the M/M/c waiting
+time by (1 + SCV) / 2: the Pollaczek-Khinchine formula for c = 1 (exact)
+and the Allen-Cunneen approximation for c > 1 (Poisson arrivals).
+'''
+
+import numpy as np
+from functools import lru_cache
+
+
+@lru_cache(maxsize=65536)
+def _erlang_b(c, a):
+    B = 1.0
+    for k in range(1, c + 1):
+        B = a * B / (k + a * B)
+    return B
+
+
+def erlang_b(c, a):
+    """
+    Returns the Erlang-B blocking probability of `c` servers at offered load `a` = lambda / mu.
+    """
+    if np.ndim(c) == 0 and np.ndim(a) == 0:
+        return _erlang_b(int(c), float(a))
+
+    c, a = np.broadcast_arrays(np.asarray(c, dtype=int), np.asarray(a, dtype=float))
+    B = np.ones(a.shape)
+    for k in range(1, c.max() + 1):
+        B = np.where(k <= c, a * B / (k + a * B), B)
+    return B
+
+
+def erlang_c(c, a):
+    """
+    Returns the Erlang-C probability that a customer has to wait, for `c` servers at offered load `a`.
+    One for unstable systems (rho = a / c >= 1).
+    """
+    B = erlang_b(c, a)
+    rho = np.asarray(a, dtype=float) / c
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(rho < 1, B / (1 - rho * (1 - B)), 1.0)[()]
+
+
+def empty_probability(c, a):
+    """
+    Returns the probability p_0 that the system is empty, for `c` servers at offered load `a`.
+    Uses sum_{k<=c} a^k / k! = (a^c / c!) / B, with a^c / c! in log space.
+    Zero for unstable systems (rho = a / c >= 1), where the queue grows without bound.
+    """
+    from scipy.special import gammaln
+
+    B = erlang_b(c, a)
+    rho = np.asarray(a, dtype=float) / c  # float64, so that rho = 1 divides to inf instead of raising
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        p_0 = np.exp(gammaln(np.add(c, 1)) - c * np.log(a)) / (1 / B - 1 + 1 / (1 - rho))
+    return np.where(rho < 1, p_0, 0.0)[()]
+
+
+@lru_cache(maxsize=65536)
+def _mmc_metrics(arrival_rate, service_rate, c):
+    return _mmc_metrics_array(arrival_rate, service_rate, c)
+
+
+def _mmc_metrics_array(arrival_rate, service_rate, c):
+    a = arrival_rate / service_rate
+    rho = a / c
+    stable = rho < 1  # else the queue grows without bound
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        delay_prob = np.where(stable, erlang_c(c, a), 1.0)
+        return {
+            'p_0': np.where(stable, empty_probability(c, a), 0.0)[()],
+            'delay probability': delay_prob[()],
+            'expected queue length': np.where(stable, delay_prob * rho / (1 - rho), np.inf)[()],
+            'expected waiting time': np.where(stable, delay_prob / (c * service_rate * (1 - rho)), np.inf)[()],
+        }
+
+
+def mmc_metrics(arrival_rate, service_rate, c):
+    """
+    Description
+    -----------
+    Returns a dict with the expected performance measures of an M/M/c queue,
+    as `QueueMetrics.get_expected_metrics`. Unstable systems (rho = lambda / (c mu) >= 1)
+    get an infinite queue length and waiting time.
+
+    Parameters
+    ----------
+    arrival_rate : `float` or `np.ndarray`
+        Mean arrival rate (lambda).
+    service_rate : `float` or `np.ndarray`
+        Mean service rate (mu) per server.
+    c : `int` or `np.ndarray`
+        Number of servers.
+    """
+
+    if np.ndim(arrival_rate) == 0 and np.ndim(service_rate) == 0 and np.ndim(c) == 0:
+        return dict(_mmc_metrics(float(arrival_rate), float(service_rate), int(c)))
+    return _mmc_metrics_array(np.asarray(arrival_rate, dtype=float), np.asarray(service_rate, dtype=float), np.asarray(c, dtype=int))
+
+
+def mgc_metrics(arrival_rate, mean_service_time, scv, c):
+    """
+    Description
+    -----------
+    Returns a dict with the expected performance measures of an M/G/c FIFO queue,
+    as `mmc_metrics`. The queue length and waiting time are those of M/M/c with the
+    same mean service time, times (1 + scv) / 2: exact for c = 1 (Pollaczek-Khinchine),
+    the Allen-Cunneen approximation for c > 1. p_0 and the delay probability are
+    those of M/M/c, which are exact for c = 1 only.
+
+    Parameters
+    ----------
+    arrival_rate : `float` or `np.ndarray`
+        Mean arrival rate (lambda).
+    mean_service_time : `float` or `np.ndarray`
+        Mean service time E[S].
+    scv : `float` or `np.ndarray`
+        Squared coefficient of variation of the service time, Var[S] / E[S]^2.
+    c : `int` or `np.ndarray`
+        Number of servers.
+    """
+
+    metrics = mmc_metrics(arrival_rate, 1 / np.asarray(mean_service_time, dtype=float), c)
+    factor = (1 + np.asarray(scv, dtype=float)) / 2
+    metrics['expected queue length'] = metrics['expected queue length'] * factor
+    metrics['expected waiting time'] = metrics['expected waiting time'] * factor
+    return metrics
+
+
+def waiting_time_quantile(q, arrival_rate, mean_service_time, scv, c):
+    """
+    Description
+    -----------
+    Returns the q-quantile of the waiting time of an M/G/c FIFO queue, with the
+    exponential tail P(W > t) = D exp(-t D / E[W]) of M/M/c, where D is the delay
+    probability and E[W] the expected waiting time of `mgc_metrics`. Exact for
+    M/M/c (scv = 1), an approximation otherwise. Zero if at most a fraction 1 - q
+    of the customers waits, infinite for unstable systems.
+
+    Parameters
+    ----------
+    q : `float`
+        Quantile, f.e. 0.95 for P95.
+    arrival_rate, mean_service_time, scv, c
+        As in `mgc_metrics`.
+    """
+
+    metrics = mgc_metrics(arrival_rate, mean_service_time, scv, c)
+    delay_prob, mean_wait = metrics['delay probability'], metrics['expected waiting time']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(delay_prob > 1 - q, mean_wait / delay_prob * np.log(delay_prob / (1 - q)), 0.0)[()]
@@ -0,0 +1,97 @@
+'''
+Estimators for replications run with variance reduction: paired differences
+under common random numbers, antithetic pairs and control variates, and the
+ratio estimator of regenerative cycles.
+'''
+
+import math
+import numpy as np
+
+
+def mean_ci(values, confidence=0.95, dof=None):
+    """
+    Returns (mean, half-width of the Student-t confidence interval) of `values`,
+    with `dof` degrees of freedom (default n - 1).
+    """
+    from scipy.stats import t
+
+    values = np.asarray(values, dtype=float)
+    n = values.size
+    dof = n - 1 if dof is None else dof
+    if dof < 1:
+        return (values.mean() if n else math.nan), math.inf
+    return values.mean(), t.ppf(0.5 + confidence / 2, dof) * values.std(ddof=1) / math.sqrt(n)
+
+
+def ratio_ci(numerators, denominators, confidence=0.95):
+    """
+    Returns (ratio, half-width of the confidence interval) of sum(numerators) / sum(denominators)
+    over i.i.d. pairs, f.e. the regenerative cycles of `regenerative.busy_cycles`. The interval
+    follows from the central limit theorem for numerators - ratio * denominators.
+    """
+    from scipy.stats import t
+
+    numerators = np.asarray(numerators, dtype=float)
+    denominators = np.asarray(denominators, dtype=float)
+    n = numerators.size
+    ratio = numerators.sum() / denominators.sum() if n else math.nan
+    if n < 2:
+        return ratio, math.inf
+    deviations = numerators - ratio * denominators
+    return ratio, t.ppf(0.5 + confidence / 2, n - 1) * deviations.std(ddof=1) / (denominators.mean() * math.sqrt(n))
+
+
+def paired_difference(x, y, confidence=0.95):
+    """
+    Returns (mean, CI half-width) of the difference between two systems run
+    with common random numbers, where x[i] and y[i] share the streams of seed i.
+    """
+    return mean_ci(np.asarray(x) - np.asarray(y), confidence)
+
+
+def antithetic_means(values):
+    """
+    Returns the means of antithetic pairs (values[2i], values[2i + 1]),
+    which are independent replications for a confidence interval.
+    """
+    values = np.asarray(values, dtype=float)
+    return values[:values.size // 2 * 2].reshape(-1, 2).mean(axis=1)
+
+
+def control_variate_estimate(values, controls, expectations, confidence=0.95):
+    """
+    Description
+    -----------
+    Control-variate estimate of the mean of `values`. The controls are
+    regressed out with the least-squares coefficients beta:
+    values - (controls - expectations) @ beta.
+
+    Parameters
+    ----------
+    values : `np.ndarray`
+        (n,) replication outputs.
+    controls : `np.ndarray`
+        (n, k) controls per replication, f.e. `QueueSimulation.get_controls()`.
+    expectations : `np.ndarray`
+        (k,) known expectations of the controls.
+
+    Returns
+    -------
+    mean, half_width, beta
+        Estimate, CI half-width (n - k - 1 degrees of freedom) and coefficients.
+        Controls without variance (f.e. deterministic service) get beta = 0.
+    """
+
+    values = np.asarray(values, dtype=float)
+    controls = np.asarray(controls, dtype=float).reshape(values.size, -1)
+    expectations = np.asarray(expectations, dtype=float)
+
+    deviations = controls - controls.mean(axis=0)
+    used = deviations.std(axis=0) > 0
+    beta = np.zeros(controls.shape[1])
+    if used.any() and values.size > used.sum() + 1:
+        beta[used] = np.linalg.lstsq(deviations[:, used], values - values.mean(), rcond=None)[0]
+
+    adjusted = values - (controls - expectations) @ beta
+    mean, half_width = mean_ci(adjusted, confidence, dof=values.size - int(np.count_nonzero(beta)) - 1)
+    return mean, half_width, beta
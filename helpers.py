@@ -1,4 +1,8 @@
-import math
+'''
+Helper functions of the command-line interface. Only the standard library is
+imported at module level, so that `error_message` can check the arguments
+before NumPy and the simulation modules are loaded.
+'''
 
 def error_message(args):
     """
@@ -11,42 +15,70 @@ def error_message(args):
         return "Ärrival rate may only be Markovian"
     elif args.queue_system[1] not in ["M", "D", "H"]:
         return "Service time distribution must be M, D or H"
-    elif args.arrival_rate / (args.service_rate * int(args.queue_system[-1])) >= 1:
+    elif utilization(args.queue_system[1], args.arrival_rate, args.service_rate, int(args.queue_system[-1])) >= 1:
         return "Service utilization rho must be smaller than one"
     elif args.discipline not in ["FIFO", "SJF"]:
         return "Queue discipline must be FIFO or SJF (shortest jobs first)"
+    elif args.engine not in ["simpy", "native", "vectorized", "jit"]:
+        return "Simulation engine must be simpy, native, vectorized or jit"
+    elif args.engine == "vectorized" and args.discipline != "FIFO":
+        return "The vectorized engine only supports FIFO"
+    elif args.workers < 1:
+        return "Number of workers must be at least one"
+    elif args.format not in ["csv", "npz", "parquet"]:
+        return "Output format must be csv, npz or parquet"
+    elif args.streaming and args.save_raw:
+        return "Raw data cannot be saved with streaming statistics"
+    elif args.target_ci is not None and args.target_ci <= 0:
+        return "Target CI half-width must be positive"
+    elif not 0 < args.confidence < 1:
+        return "Confidence level must be between zero and one"
+    elif args.long_run and (args.target_ci is not None or args.save_raw):
+        return "A long run cannot be combined with --target-ci or --save_raw"
+    elif args.regenerative and (args.long_run or args.save_raw or args.streaming or args.antithetic or args.crn or args.control_variates):
+        return "Regenerative runs cannot be combined with --long-run, --save_raw, --streaming or shared random streams"
+    elif args.antithetic and args.n % 2:
+        return "Antithetic pairs require an even number of simulations"
+    elif args.customer_trace and not args.save_raw:
+        return "The customer trace is only kept with --save_raw"
     return None
 
 
+def utilization(B, arrival_rate, service_rate, c):
+    """
+    Returns the load rho = lambda E[S] / c on the actual mean service time of distribution `B`
+    (for 'H' this is not lambda / (c mu)); the system is stable if rho < 1.
+    """
+    from Queue import service_time_moments
+    return arrival_rate * service_time_moments(B, service_rate)[0] / c
+
+
+def averages_title(queue_system, n, rho, max_runtime, discipline, extension="csv", long_run=False, regenerative=False):
+    """
+    Returns the file name under which averages of n replications (or n batches of one long run,
+    or n regenerative segments) are saved.
+    """
+    suffix = "_longrun" if long_run else "_regenerative" if regenerative else ""
+    return f"averages_{queue_system}_n{n}_rho{rho}_max_runtime{max_runtime}_{discipline}{suffix}.{extension}"
+
+
 def calc_p0(rho, c):
     """
     Returns probability customer visits an empty system.
     """
-    
-    if c == 1:
-        return 1 - rho
-    else:
-        s = 0
-        for k in range(c):
-            # summation
-            s += (c * rho)**k / math.factorial(k)
-
-        # add last component
-        s += (c * rho)**c / (math.factorial(c) * (1 - rho))
-        p_0 = s**(-1)
-        return p_0
+    import numpy as np
+    import erlang
+    return erlang.empty_probability(c, np.multiply(c, rho))
 
 
 def calc_delay_prob(p_0, rho, c):
     """
-    Returns probability customer will have to wait for service.
+    Returns probability customer will have to wait for service (Erlang-C).
+    `p_0` is no longer needed, Erlang-C follows directly from rho and c.
     """
-    if c == 1:
-        return rho
-    else:
-        p_c = p_0 * ((c * rho)**c / math.factorial(c))
-        p_d = p_c / (1 - rho)
-        return p_d
+    import numpy as np
+    import erlang
+    return erlang.erlang_c(c, np.multiply(c, rho))
 
 
 def calc_exp_length(delay_prob, rho):
@@ -60,6 +92,5 @@ def calc_exp_wait(rho, c, service_rate):
     """
     Queue wait time using little's law - excludes service
     """
-    p0 = calc_p0(rho, c)
-    delay_prob = calc_delay_prob(p0, rho, c)
-    return delay_prob / (c * service_rate * (1 - rho))
\ No newline at end of file
+    delay_prob = calc_delay_prob(None, rho, c)
+    return delay_prob / (c * service_rate * (1 - rho))
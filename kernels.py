@@ -0,0 +1,219 @@
+'''
+Numba-compiled event loop of the 'jit' engine of `QueueSimulation`.
+
+The kernel runs the same single-station event loop as
+`QueueSimulation.run_native`, with the same floating-point operations in the
+same order, on variates drawn up front from the simulation's own streams,
+so a seed gives the same log as the native engine. Servers are a binary
+heap of departure times; FIFO customers wait in arrival order, so the queue
+is just the range of ids that arrived but did not start yet, and SJF
+customers wait in a binary heap of ids on (service time, id).
+
+Compiled code is cached on disk (`cache=True`, in `__pycache__`), so only
+the first run after a change of this file pays for compilation. Requires
+the optional `numba` package: `QueueSimulation` falls back to the native
+engine without it.
+'''
+
+import math
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def _push_time(heap, size, value):
+    '''
+    Adds `value` to the min-heap `heap[:size]`.
+    '''
+    i = size
+    heap[i] = value
+    while i > 0:
+        parent = (i - 1) // 2
+        if heap[parent] <= heap[i]:
+            break
+        heap[parent], heap[i] = heap[i], heap[parent]
+        i = parent
+
+
+@njit(cache=True)
+def _pop_time(heap, size):
+    '''
+    Removes the minimum of the min-heap `heap[:size]`.
+    '''
+    size -= 1
+    heap[0] = heap[size]
+    i = 0
+    while True:
+        child = 2 * i + 1
+        if child >= size:
+            break
+        if child + 1 < size and heap[child + 1] < heap[child]:
+            child += 1
+        if heap[i] <= heap[child]:
+            break
+        heap[child], heap[i] = heap[i], heap[child]
+        i = child
+
+
+@njit(cache=True)
+def _shorter(service_times, a, b):
+    # SJF order: shorter service first, then earlier arrival (as `HeapQueue`)
+    return service_times[a] < service_times[b] or (service_times[a] == service_times[b] and a < b)
+
+
+@njit(cache=True)
+def _push_job(heap, size, service_times, customer):
+    '''
+    Adds `customer` to the SJF heap `heap[:size]` of customer ids.
+    '''
+    i = size
+    heap[i] = customer
+    while i > 0:
+        parent = (i - 1) // 2
+        if not _shorter(service_times, heap[i], heap[parent]):
+            break
+        heap[parent], heap[i] = heap[i], heap[parent]
+        i = parent
+
+
+@njit(cache=True)
+def _pop_job(heap, size, service_times):
+    '''
+    Removes and returns the shortest job of the SJF heap `heap[:size]`.
+    '''
+    customer = heap[0]
+    size -= 1
+    heap[0] = heap[size]
+    i = 0
+    while True:
+        child = 2 * i + 1
+        if child >= size:
+            break
+        if child + 1 < size and _shorter(service_times, heap[child + 1], heap[child]):
+            child += 1
+        if not _shorter(service_times, heap[child], heap[i]):
+            break
+        heap[child], heap[i] = heap[i], heap[child]
+        i = child
+    return customer
+
+
+@njit(cache=True)
+def event_loop(times, service_times, n_servers, sjf, max_runtime, waiting_times, queue_lengths, waits, trace_t, trace_N, trace_interval, n_trace, next_trace):
+    '''
+    Description
+    -----------
+    Runs the event loop of `QueueSimulation.run_native` on arrays.
+
+    Parameters
+    ----------
+    times : `np.ndarray`
+        Inter-arrival times, overwritten with the arrival times of the
+        customers that arrived (the first customer arrives at t=0).
+    service_times : `np.ndarray`
+        Service times, in arrival order.
+    waiting_times, queue_lengths : `np.ndarray`
+        Logs to fill, in order of service start and of arrival.
+    waits : `np.ndarray`
+        Waiting time per customer id to fill (NaN if not started), or an empty array.
+    trace_t, trace_N, trace_interval, n_trace, next_trace
+        Decimated trace of the number in system, as in `TimeWeightedState`.
+
+    Returns
+    -------
+    now, n_waiting_times, n_queue_lengths, area_queue, area_service, in_queue, in_service, n_trace, next_trace
+    '''
+
+    n = times.size
+    trace_size = trace_t.size
+    keep_waits = waits.size > 0
+
+    departures = np.empty(n_servers)  # min-heap of departure times
+    n_busy = 0
+    jobs = np.empty(n if sjf else 0, dtype=np.int64)  # SJF min-heap of waiting ids
+    n_jobs = 0
+    head = 0  # FIFO: first waiting id
+
+    now = next_arrival = 0.0
+    n_arrived = n_wait = 0
+    area_queue = area_service = 0.0
+
+    while True:
+
+        n_waiting = n_jobs if sjf else n_arrived - head
+        departure = n_busy > 0 and (departures[0] <= next_arrival or n_arrived >= n)
+        if departure: now = departures[0]
+        elif n_arrived >= n: break
+        else: now = next_arrival
+        if now >= max_runtime: break
+
+        if next_trace < now:
+            n_new = min(trace_size, math.ceil(now / trace_interval))
+            for j in range(n_trace, n_new):
+                trace_t[j] = j * trace_interval
+                trace_N[j] = n_busy + n_waiting
+            n_trace = n_new
+            next_trace = n_new * trace_interval if n_new < trace_size else np.inf
+
+        # Next event is a departure:
+        if departure:
+            _pop_time(departures, n_busy)
+            n_busy -= 1
+
+            # Start service of next customer in queue:
+            if n_waiting:
+                if sjf:
+                    i = _pop_job(jobs, n_jobs, service_times)
+                    n_jobs -= 1
+                else:
+                    i = head
+                    head += 1
+                t_wait = now - times[i]
+                waiting_times[n_wait] = t_wait
+                n_wait += 1
+                if keep_waits: waits[i] = t_wait
+                area_queue += t_wait
+                area_service += service_times[i]
+                _push_time(departures, n_busy, now + service_times[i])
+                n_busy += 1
+
+        # Next event is an arrival:
+        else:
+            i = n_arrived
+            n_arrived += 1
+            queue_lengths[i] = n_waiting
+            next_arrival = now + times[i]
+            times[i] = now
+            t_service = service_times[i]
+
+            # Serve immediately if a server is free, else join queue:
+            if n_busy < n_servers:
+                if not sjf: head += 1  # the queue is empty
+                waiting_times[n_wait] = 0.0
+                n_wait += 1
+                if keep_waits: waits[i] = 0.0
+                area_service += t_service
+                _push_time(departures, n_busy, now + t_service)
+                n_busy += 1
+            elif sjf:
+                _push_job(jobs, n_jobs, service_times, i)
+                n_jobs += 1
+
+    now = min(now, max_runtime)
+    n_waiting = n_jobs if sjf else n_arrived - head
+
+    # Add the waits of customers still in queue and remove the
+    # service after the end of customers still in service:
+    queued = remaining = 0.0
+    if sjf:
+        for j in range(n_jobs):
+            queued += now - times[jobs[j]]
+    else:
+        for i in range(head, n_arrived):
+            queued += now - times[i]
+    for j in range(n_busy):
+        remaining += departures[j] - now
+    area_queue += queued
+    area_service -= remaining
+
+    return now, n_wait, n_arrived, area_queue, area_service, n_waiting, n_busy, n_trace, next_trace
@@ -1,42 +1,337 @@
-from Queue import *
-from Metrics import *
-from helpers import error_message
+# NumPy, SimPy and the simulation modules are imported where they are used,
+# so that invalid arguments are reported without loading them.
+from helpers import error_message, averages_title
+from cache import CACHE_DIR
+from contextlib import nullcontext
+from functools import partial
+from types import SimpleNamespace
 import argparse
 
 # For testing purposes:
 # import time
 
-def main(queue_system, n, arrival_rate, service_rate, max_runtime, max_customers, discipline, save, save_raw):
-    # Simulation params
+MIN_REPLICATIONS = 10  # replications per batch when running to a target CI
+LONG_RUN_BATCHES = 20  # batches of the confidence interval of a long run
+STREAMS = (None, "crn", "antithetic")  # random streams of replications, see `replication_streams`
+
+
+def replication_streams(replication, max_customers, streams=None):
+    """
+    Returns the shared random streams of a replication: None (own seed),
+    common random numbers of seed `replication` ("crn") or antithetic
+    pairs ("antithetic"), where replications 2k and 2k + 1 use the
+    streams of seed k and their antithetic counterpart.
+    """
+    from Queue import CommonRandomNumbers
+
+    if streams is None:
+        return None
+    if streams == "crn":
+        return CommonRandomNumbers(replication, max_customers)
+    pair = CommonRandomNumbers(replication // 2, max_customers)
+    return pair.antithetic() if replication % 2 else pair
+
+
+def run_parameters(queue_system, arrival_rate, service_rate, max_runtime, max_customers, discipline, engine, seed=None):
+    """
+    Returns the parameters of the runs under the attribute names of `QueueSimulation`, for the
+    expected metrics (`QueueMetrics`), output names and metadata without setting up a simulation.
+    """
+    return SimpleNamespace(
+        n_servers=int(queue_system[2]), discipline=discipline, mean_service_rate=service_rate, mean_arrival_rate=arrival_rate,
+        max_customers=max_customers, max_runtime=max_runtime, seed=seed, B=queue_system[1], engine=engine
+    )
+
+
+def run_replications(seeds, queue_system, arrival_rate, service_rate, max_runtime, max_customers, discipline, save_raw, engine, cache_dir=None, output_format="csv", streaming=False, streams=None, customer_trace=False):
+    """
+    Runs one simulation per seed, unless its summary is in the cache at `cache_dir`.
+    Returns a list of (average waiting time, average queue length, n_wait, n_queue) per seed,
+    followed by the controls of `QueueSimulation.get_controls` with shared `streams`.
+    """
+    from Queue import QueueSimulation
+    from Metrics import QueueMetrics
+    from cache import get_cache, simulation_params
+
+    n_servers = int(queue_system[2])
+    B = queue_system[1]
+    cache = get_cache(cache_dir) if cache_dir and not save_raw else None
+    results = []
+
+    for seed in seeds:
+        params = simulation_params(n_servers, discipline, service_rate, arrival_rate, max_customers, max_runtime, seed, B, engine, streams, streaming)
+        summary = cache.get(params) if cache else None
+
+        if summary is None:
+            simulation = QueueSimulation(
+                n_servers, discipline, service_rate, arrival_rate, max_customers, max_runtime, B=B, seed=seed, engine=engine, raw_logs=not streaming,
+                streams=replication_streams(seed, max_customers, streams), customer_trace=customer_trace
+                )
+            simulation.run()
+
+            # save average results
+            summary = simulation.get_summary()
+            if streams: summary += simulation.get_controls()
+            if cache: cache.put(params, summary)
+
+            if save_raw:
+                QueueMetrics(simulation).save_raw(queue_system, seed=seed, output_format=output_format)
+
+        results.append(summary)
+
+    return results
+
+
+def run_replication_batch(seeds, queue_system, arrival_rate, service_rate, max_runtime, max_customers, discipline, save_raw, engine, cache_dir=None, output_format="csv", streaming=False, streams=None, customer_trace=False):
+    """
+    Runs all seeds missing from the cache in lockstep (FIFO fast path), same output as `run_replications`.
+    """
+    import numpy as np
+    from Queue import simulate_fifo_replications
+    from cache import get_cache, simulation_params
+
+    n_servers = int(queue_system[2])
+    B = queue_system[1]
+    cache = get_cache(cache_dir) if cache_dir else None
+    params = [simulation_params(n_servers, discipline, service_rate, arrival_rate, max_customers, max_runtime, seed, B, engine) for seed in seeds]
+    results = [cache.get(p) for p in params] if cache else [None] * len(seeds)
+    missing = [i for i, summary in enumerate(results) if summary is None]
+
+    if missing:
+        waiting_matrix, queue_matrix = simulate_fifo_replications(
+            n_servers, service_rate, arrival_rate, max_customers, max_runtime, seeds=[seeds[i] for i in missing], B=B
+            )
+        avg_waiting_times = np.nanmean(waiting_matrix, axis=1)
+        avg_queue_lengths = np.nanmean(queue_matrix, axis=1)
+        n_wait = np.count_nonzero(~np.isnan(waiting_matrix), axis=1)
+        n_queue = np.count_nonzero(~np.isnan(queue_matrix), axis=1)
+
+        for i, summary in zip(missing, zip(avg_waiting_times, avg_queue_lengths, n_wait, n_queue)):
+            results[i] = summary
+            if cache: cache.put(params[i], (float(summary[0]), float(summary[1]), int(summary[2]), int(summary[3])))
+
+    return results
+
+
+def replication_tasks(queue_system, n, arrival_rate, service_rate, max_runtime, max_customers, discipline, save_raw, engine, workers, cache_dir=None, output_format="csv", streaming=False, first_seed=0, streams=None, customer_trace=False):
+    """
+    Returns the replication task for one configuration and the chunks of seeds
+    (first_seed, ..., first_seed + n - 1) to map it over.
+    Each seed fully determines its replication, so results do not depend on how seeds are split.
+    Streaming runs are never batched: the lockstep path keeps every waiting time of every seed.
+    """
+    import numpy as np
+
+    seeds = np.arange(first_seed, first_seed + n)
+    if engine == "vectorized" and not save_raw and not streaming and streams is None:
+        task = run_replication_batch
+        chunks = [chunk.tolist() for chunk in np.array_split(seeds, workers) if chunk.size]
+    else:
+        task = run_replications
+        chunks = [[i] for i in seeds.tolist()]
+    task = partial(
+        task, queue_system=queue_system, arrival_rate=arrival_rate, service_rate=service_rate, max_runtime=max_runtime, 
+        max_customers=max_customers, discipline=discipline, save_raw=save_raw, engine=engine, cache_dir=cache_dir,
+        output_format=output_format, streaming=streaming, streams=streams, customer_trace=customer_trace
+        )
+    return task, chunks
+
+
+def profile_replication(queue_system, arrival_rate, service_rate, max_runtime, max_customers, discipline, engine="simpy", streaming=False, streams=None):
+    """
+    Runs the first replication (seed 0) again with profiling and prints where its time went.
+    """
+    from Queue import QueueSimulation
+    from profiling import format_profile
+
+    simulation = QueueSimulation(
+        int(queue_system[2]), discipline, service_rate, arrival_rate, max_customers, max_runtime, B=queue_system[1], seed=0, engine=engine,
+        raw_logs=not streaming, streams=replication_streams(0, max_customers, streams), profile=True
+        )
+    simulation.run()
+    print("")
+    print(format_profile(simulation.get_profile()))
+
+
+def long_run(queue_system, arrival_rate, service_rate, max_runtime, max_customers, discipline, save, engine="simpy", output_format="csv", confidence=0.95, profile=False):
+    """
+    Runs a single long simulation with streaming statistics. The warm-up is dropped
+    by MSER-5 and the confidence intervals are formed from batch means.
+    """
+    from Queue import QueueSimulation
+    from Metrics import QueueMetrics
+    from writers import get_writer, simulation_metadata
+    from profiling import format_profile
+
+    n_servers = int(queue_system[2])
+    B = queue_system[1]
+
+    print('Running single long queueing system simulation...')
+    simulation = QueueSimulation(
+        n_servers, discipline, service_rate, arrival_rate, max_customers, max_runtime, B=B, seed=0, engine=engine, raw_logs=False, profile=profile
+        )
+    simulation.run()
+    Metrics = QueueMetrics(simulation)
+
+    print('Simulation finished!')
+    print('')
+
+    # save the batch means as averages, one row per batch
+    if save:
+        stream = simulation.stream
+        batch_waiting_times = stream.waiting_time_batches.batches(LONG_RUN_BATCHES)
+        batch_queue_lengths = stream.queue_length_batches.batches(LONG_RUN_BATCHES)
+        n = min(batch_waiting_times.size, batch_queue_lengths.size)
+        writer = get_writer(output_format)
+        title = averages_title(queue_system, n, Metrics.rho, simulation.max_runtime, simulation.discipline, writer.extension, long_run=True)
+        metadata = simulation_metadata(simulation, queue_system=queue_system, n=n, rho=Metrics.rho, long_run=True)
+        writer.write_averages("./data/simulation_averages/"+ title, batch_waiting_times[-n:], batch_queue_lengths[-n:], metadata)
+        print(f"Output saved to {title}")
+
+    print("EXPECTED")
+    expected_metrics = Metrics.get_expected_metrics()
+    for key, value in expected_metrics.items():
+        print(f"{key} = {value:.3f}")
+
+    print(f"\nBATCH MEANS ({confidence:.0%} CI, {LONG_RUN_BATCHES} batches)")
+    for key, (mean, half_width, warm_up) in Metrics.get_batch_means_metrics(LONG_RUN_BATCHES, confidence).items():
+        print(f"{key}: {mean:.3f} +/- {half_width:.3f} (dropped {warm_up} warm-up observations)")
+
+    if profile:
+        print("")
+        print(format_profile(simulation.get_profile()))
+
+
+def regenerative(queue_system, n, arrival_rate, service_rate, max_runtime, max_customers, discipline, save, engine="simpy", workers=1, output_format="csv", target_ci=None, confidence=0.95, profile=False):
+    """
+    Runs n independent segments (seeds 0, ..., n - 1) on `workers` processes, splits them
+    into busy cycles and estimates the long-run averages with ratio confidence intervals
+    over all complete cycles. With a target CI, runs batches of segments until the CI
+    half-width of the mean waiting time is small enough (n is then the maximum).
+    """
+    import multiprocessing
+    from Metrics import QueueMetrics
+    from writers import get_writer, simulation_metadata
+    from regenerative import simulate_cycles, pool_cycles, segment_averages, cycle_estimates
+
     n_servers = int(queue_system[2])
     B = queue_system[1]
+    task = partial(
+        simulate_cycles, n_servers=n_servers, discipline=discipline, service_rate=service_rate, arrival_rate=arrival_rate,
+        max_customers=max_customers, max_runtime=max_runtime, B=B, engine=engine
+        )
+    batch_size = max(MIN_REPLICATIONS, 2 * workers) if target_ci else n
+    segments = []
+
+    with multiprocessing.Pool(workers) if workers > 1 else nullcontext() as pool:
+        while len(segments) < n:
+            seeds = range(len(segments), min(len(segments) + batch_size, n))
+            for cycles in pool.imap(task, seeds) if pool else map(task, seeds):
+                segments.append(cycles)
+                print(f'Running regenerative segment {len(segments)}/{n}...       ', end="\r")
+
+            if target_ci:
+                _, half_width = cycle_estimates(pool_cycles(segments), confidence)["Average waiting time"]
+                if half_width < target_ci:
+                    print(f"\nReached CI half-width {half_width:.4f} < {target_ci} after {len(segments)} segments", end="")
+                    break
+
+    n = len(segments)
+    cycles = pool_cycles(segments)
+
+    # parameters of the last segment, for metrics and output names
+    simulation = run_parameters(queue_system, arrival_rate, service_rate, max_runtime, max_customers, discipline, engine, seed=n-1)
+    Metrics = QueueMetrics(simulation)
+
+    print('\nAll simulations finished!')
+    print('')
+
+    # save the averages over the complete cycles of each segment
+    if save:
+        avg_waiting_times, avg_queue_lengths = segment_averages(segments)
+        writer = get_writer(output_format)
+        title = averages_title(queue_system, n, Metrics.rho, simulation.max_runtime, simulation.discipline, writer.extension, regenerative=True)
+        metadata = simulation_metadata(simulation, queue_system=queue_system, n=n, rho=Metrics.rho, regenerative=True, cycles=int(cycles['customers'].size))
+        writer.write_averages("./data/simulation_averages/"+ title, avg_waiting_times, avg_queue_lengths, metadata)
+        print(f"Output saved to {title}")
+
+    print("EXPECTED")
+    expected_metrics = Metrics.get_expected_metrics()
+    for key, value in expected_metrics.items():
+        print(f"{key} = {value:.3f}")
+
+    print(f"\nREGENERATIVE ({confidence:.0%} CI, {cycles['customers'].size} busy cycles of {cycles['customers'].sum()} customers)")
+    for key, (mean, half_width) in cycle_estimates(cycles, confidence).items():
+        print(f"{key}: {mean:.3f} +/- {half_width:.3f}")
+
+    if profile:
+        profile_replication(queue_system, arrival_rate, service_rate, max_runtime, max_customers, discipline, engine)
+
+
+def main(queue_system, n, arrival_rate, service_rate, max_runtime, max_customers, discipline, save, save_raw, engine="simpy", workers=1, cache_dir=None, output_format="csv", streaming=False, target_ci=None, confidence=0.95, streams=None, control_variates=False, profile=False, customer_trace=False):
+    import numpy as np
+    import multiprocessing
+    from Metrics import QueueMetrics
+    from writers import get_writer, simulation_metadata
+    from streaming import RunningStats
+
+    # Simulation params
     avg_waiting_times, avg_queue_lengths = np.zeros(n), np.zeros(n)
+    controls = []
+
+    # With a target CI, run batches of replications until the CI half-width
+    # of the mean waiting time is small enough (n is then the maximum).
+    # Antithetic pairs count as one replication.
+    batch_size = max(MIN_REPLICATIONS, 2 * workers) if target_ci else n
+    stats = RunningStats()
+    i = total_wait = total_queue = 0
 
-    # Running n simulations
-    for i in range(n):
-        print(f'Running queueing system simulation {i+1}/{n}...       ', end="\r")
+    with multiprocessing.Pool(workers) if workers > 1 else nullcontext() as pool:
+        while i < n:
 
-        simulation = QueueSimulation(n_servers, discipline, service_rate, arrival_rate, max_customers, max_runtime, B=B, seed=i)
-        simulation.run()
+            # Split seeds of this batch over workers
+            task, chunks = replication_tasks(
+                queue_system, min(batch_size, n - i), arrival_rate, service_rate, max_runtime, max_customers, discipline, 
+                save_raw, engine, workers, cache_dir, output_format, streaming, first_seed=i, streams=streams,
+                customer_trace=customer_trace
+                )
 
-        # save average results
-        waiting_lists, queue_lengths = simulation.get_log()
-        avg_waiting_times[i] = np.mean(waiting_lists)
-        avg_queue_lengths[i] = np.mean(queue_lengths)
+            # Running simulations (pool.imap returns chunks in seed order)
+            chunksize = max(1, len(chunks) // (4 * workers))
+            results = pool.imap(task, chunks, chunksize) if pool else map(task, chunks)
 
-        Metrics = QueueMetrics(simulation)
-        if save_raw:
-            Metrics.to_csv(queue_system, seed=i)
-        
+            for chunk in results:
+                for avg_wait, avg_length, n_wait, n_queue, *control in chunk:
+                    avg_waiting_times[i], avg_queue_lengths[i] = avg_wait, avg_length
+                    total_wait += n_wait
+                    total_queue += n_queue
+                    controls.append(control)
+                    if streams != "antithetic": stats.update(avg_wait)
+                    elif i % 2: stats.update((avg_waiting_times[i - 1] + avg_wait) / 2)
+                    i += 1
+                print(f'Running queueing system simulation {i}/{n}...       ', end="\r")
+
+            if target_ci and stats.ci_half_width(confidence) < target_ci:
+                print(f"\nReached CI half-width {stats.ci_half_width(confidence):.4f} < {target_ci} after {i} replications", end="")
+                break
+
+    # Only keep replications that were run
+    n = i
+    avg_waiting_times, avg_queue_lengths = avg_waiting_times[:n], avg_queue_lengths[:n]
+
+    # parameters of the last replication, for metrics and output names
+    simulation = run_parameters(queue_system, arrival_rate, service_rate, max_runtime, max_customers, discipline, engine, seed=n-1)
+    Metrics = QueueMetrics(simulation)
     
     print('\nAll simulations finished!')
     print('')
 
     # save average metrics to csv
     if save:
-        data = np.vstack((avg_waiting_times, avg_queue_lengths)).T
-        title = f"averages_{queue_system}_n{n}_rho{Metrics.rho}_max_runtime{simulation.max_runtime}_{simulation.discipline}.csv"
-        np.savetxt("./data/simulation_averages/"+ title, data, delimiter=',', header="avg_waiting_times, avg_queue_lengths")
+        writer = get_writer(output_format)
+        title = averages_title(queue_system, n, Metrics.rho, simulation.max_runtime, simulation.discipline, writer.extension)
+        metadata = simulation_metadata(simulation, queue_system=queue_system, n=n, rho=Metrics.rho, streams=streams)
+        writer.write_averages("./data/simulation_averages/"+ title, avg_waiting_times, avg_queue_lengths, metadata)
         print(f"Output saved to {title}")
     
 
@@ -49,17 +344,48 @@ def main(queue_system, n, arrival_rate, service_rate, max_runtime, max_customers
     for wait_time, length in zip(avg_waiting_times, avg_queue_lengths):
         print(f"Average queue length: {length:.3f}, Average wait time: {wait_time:.3f} ")
 
-    waiting_lists, queue_lengths =  simulation.get_log()
     print("*****SUPER MEANS *****")
     print("Waiting time:", np.mean(avg_waiting_times))
     print("Avg queue lengths", np.mean(avg_queue_lengths))
 
-    print(f"\nn_wait: {waiting_lists.size}")
-    print(f"n_queue: {queue_lengths.size}")  
+    if streams:
+        print_variance_reduction(avg_waiting_times, np.array(controls), Metrics, streams, control_variates, confidence)
 
+    # logged waiting times and queue lengths, summed over all replications
+    print(f"\nn_wait: {total_wait}")
+    print(f"n_queue: {total_queue}")
 
-if __name__ == '__main__':
-    # set-up parsing command line arguments
+    if profile:
+        profile_replication(queue_system, arrival_rate, service_rate, max_runtime, max_customers, discipline, engine, streaming, streams)
+
+
+def print_variance_reduction(avg_waiting_times, controls, Metrics, streams, control_variates, confidence=0.95):
+    """
+    Prints confidence intervals of the mean waiting time over antithetic pairs
+    and/or with control variates, next to the plain interval.
+    """
+    import numpy as np
+    from estimators import antithetic_means, control_variate_estimate, mean_ci
+
+    mean, half_width = mean_ci(avg_waiting_times, confidence)
+    print(f"\nWAITING TIME ({confidence:.0%} CI)")
+    print(f"Replications: {mean:.4f} +/- {half_width:.4f}")
+
+    if streams == "antithetic":
+        avg_waiting_times = antithetic_means(avg_waiting_times)
+        controls = controls[:controls.shape[0] // 2 * 2].reshape(-1, 2, controls.shape[1]).mean(axis=1)
+        mean, half_width = mean_ci(avg_waiting_times, confidence)
+        print(f"Antithetic pairs ({avg_waiting_times.size}): {mean:.4f} +/- {half_width:.4f}")
+
+    if control_variates:
+        mean, half_width, beta = control_variate_estimate(avg_waiting_times, controls, Metrics.get_control_expectations(), confidence)
+        print(f"Control variates (beta = {np.round(beta, 3)}): {mean:.4f} +/- {half_width:.4f}")
+
+
+def build_parser():
+    """
+    Returns the parser of the command line arguments of `main.py`.
+    """
     parser = argparse.ArgumentParser(description="Simulate queueing systems and measure performance")
 
     # adding arguments
@@ -69,19 +395,56 @@ if __name__ == '__main__':
     parser.add_argument("-l", "--arrival_rate", help="mean arrival rate (lambda)", default=0.9, type=float)
     parser.add_argument("-m", "--service_rate", help="mean service rate (mu)", default=1, type=float)
     parser.add_argument("-d", "--discipline", help="how to select from queue (FIFO or SJF)", default="FIFO")
-    parser.add_argument("-n", help="number of simulations", default=1, type=int)
-    parser.add_argument("--save", action="store_true", help="store average results in csv")
-    parser.add_argument("--save_raw", action="store_true", help="store all data in csv for each simulation")
+    parser.add_argument("-n", help="number of simulations (maximum with --target-ci)", default=1, type=int)
+    parser.add_argument("-e", "--engine", help="simulation engine (simpy, native, vectorized or jit)", default="simpy")
+    parser.add_argument("-w", "--workers", help="number of worker processes running simulations in parallel", default=1, type=int)
+    parser.add_argument("--cache", nargs="?", const=CACHE_DIR, help="reuse per-replication results cached in this directory (default %(const)s)")
+    parser.add_argument("-f", "--format", help="output file format (csv, npz or parquet)", default="csv")
+    parser.add_argument("--streaming", action="store_true", help="keep streaming statistics instead of all waiting times")
+    parser.add_argument("--target-ci", dest="target_ci", type=float, help="stop once the CI half-width of the mean waiting time is below this value")
+    parser.add_argument("--confidence", type=float, default=0.95, help="confidence level of --target-ci, --long-run and --regenerative")
+    parser.add_argument("--long-run", dest="long_run", action="store_true", help="single long run with warm-up truncation and batch means (ignores -n)")
+    parser.add_argument("--regenerative", action="store_true", help="split n segments into busy cycles and estimate ratio confidence intervals over all cycles")
+    parser.add_argument("--crn", action="store_true", help="draw replication i from common random numbers of seed i, shared across configurations")
+    parser.add_argument("--antithetic", action="store_true", help="run replications in antithetic pairs (implies --crn)")
+    parser.add_argument("--control-variates", dest="control_variates", action="store_true", help="estimate the mean waiting time with service time control variates (implies --crn)")
+    parser.add_argument("--profile", action="store_true", help="count events and time the first simulation by section (variates, logging, scheduling)")
+    parser.add_argument("--save", action="store_true", help="store average results (see --format)")
+    parser.add_argument("--save_raw", action="store_true", help="store all data for each simulation (see --format)")
+    parser.add_argument("--customer-trace", dest="customer_trace", action="store_true", help="with --save_raw, store one record per customer (arrival, wait, service, server, queue length)")
 
-    # read arguments from command line
-    args = parser.parse_args()
+    return parser
 
+
+def run_args(args):
+    """
+    Checks parsed command line arguments and runs the simulation(s) they describe.
+    Returns the error message if the arguments are invalid, else None.
+    """
     # print error if arguments invalid, else run main with provided arguments
     error = error_message(args)
     if error:
         print(error)
+    elif args.long_run:
+        long_run(
+            args.queue_system, args.arrival_rate, args.service_rate, args.run_time, args.customers, 
+            args.discipline, args.save, args.engine, args.format, args.confidence, args.profile
+            )
+    elif args.regenerative:
+        regenerative(
+            args.queue_system, args.n, args.arrival_rate, args.service_rate, args.run_time, args.customers,
+            args.discipline, args.save, args.engine, args.workers, args.format, args.target_ci, args.confidence, args.profile
+            )
     else:
+        streams = "antithetic" if args.antithetic else "crn" if args.crn or args.control_variates else None
         main(
             args.queue_system, args.n, args.arrival_rate, args.service_rate, 
-            args.run_time, args.customers, args.discipline, args.save, args.save_raw
-            )    
\ No newline at end of file
+            args.run_time, args.customers, args.discipline, args.save, args.save_raw, args.engine, args.workers, args.cache, args.format, args.streaming, args.target_ci, args.confidence,
+            streams, args.control_variates, args.profile, args.customer_trace
+            )
+    return error
+
+
+if __name__ == '__main__':
+    # read arguments from command line
+    run_args(build_parser().parse_args())
@@ -0,0 +1,235 @@
+'''
+Opt-in instrumentation of `QueueSimulation` runs (`profile=True`).
+
+A `Profiler` counts events by type (arrival, service start, departure),
+splits the wall-clock time of the run into variate generation, logging and
+scheduling (everything else: the event queue or SimPy, server bookkeeping
+and the time-weighted state), and samples wall-clock time and queue length
+against simulated time. This shows whether a slow run is slow because the
+queue is deep, or because of logging or random numbers.
+
+Without `profile` none of this is on the simulation path: the event loops
+are unchanged and only the random streams and the logging of a profiled
+run are wrapped (the vectorized and jit engines time their few array passes). Timing every call costs more than the calls themselves,
+so this overhead is measured once and reported as 'instrumentation'
+instead of being charged to the timed sections.
+'''
+
+import time
+import numpy as np
+from contextlib import contextmanager
+
+SAMPLE_EVERY = 1000  # arrivals between samples of (simulated time, wall time, queue length)
+SECTIONS = ('variates', 'logging', 'scheduling', 'instrumentation')
+ARRAY_ENGINES = ('vectorized', 'jit')  # engines that time their own sections
+
+_timer_overhead = None
+
+
+def timer_overhead(calls=20_000, repeats=5):
+    """
+    Returns (recorded, total) wall-clock cost of one call through `Profiler.timed`
+    of a no-op: the part that ends up in the timed section and the total extra cost.
+    """
+    global _timer_overhead
+    if _timer_overhead is None:
+        profiler = Profiler()
+        noop = lambda: None
+        timed = profiler.timed('variates', noop)
+        recorded, total = [], []
+        for _ in range(repeats):
+            profiler.times['variates'] = 0.0
+            start = time.perf_counter()
+            for _ in range(calls): noop()
+            plain = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(calls): timed()
+            total.append((time.perf_counter() - start - plain) / calls)
+            recorded.append(profiler.times['variates'] / calls)
+        _timer_overhead = min(recorded), max(min(total), min(recorded))
+    return _timer_overhead
+
+
+class ProfiledLog:
+
+    '''
+    Stands in for the streaming statistics of a profiled event-loop run:
+    times every logged waiting time and queue length and forwards it to the
+    original streaming statistics or to the raw logs of the simulation.
+    '''
+
+    def __init__(self, profiler, simulation, stream):
+        self.profiler = profiler
+        self.stream = stream
+        self.waiting_times = simulation.waiting_times
+        self.queue_lengths = simulation.queue_lengths
+        self.n_waiting_times = simulation.n_waiting_times
+        self.n_queue_lengths = simulation.n_queue_lengths
+
+    def add_waiting_time(self, value):
+        start = time.perf_counter()
+        if self.stream: self.stream.add_waiting_time(value)
+        else: self.waiting_times[self.n_waiting_times] = value
+        self.n_waiting_times += 1
+        self.profiler.times['logging'] += time.perf_counter() - start
+        self.profiler.calls['logging'] += 1
+
+    def add_queue_length(self, value):
+        start = time.perf_counter()
+        if self.stream: self.stream.add_queue_length(value)
+        else: self.queue_lengths[self.n_queue_lengths] = value
+        self.n_queue_lengths += 1
+        self.profiler.queue_length = value
+        self.profiler.times['logging'] += time.perf_counter() - start
+        self.profiler.calls['logging'] += 1
+
+
+class Profiler:
+
+    '''
+    Collects the event counts, time per section and samples of one run.
+    '''
+
+    def __init__(self, sample_every=SAMPLE_EVERY):
+        self.sample_every = sample_every
+        self.times = dict.fromkeys(SECTIONS, 0.0)
+        self.calls = {'variates': 0, 'logging': 0}  # timed calls, for the instrumentation overhead
+        self.events = {'arrival': 0, 'service start': 0, 'departure': 0}
+        self.clock = 0.0  # simulated time of the current arrival
+        self.queue_length = 0  # at the last logged arrival
+        self.samples = []
+        self.start = None
+        self.wall_time = self.simulated_time = 0.0
+        self.engine = None
+
+
+    def timed(self, section, function):
+        '''
+        Returns `function` wrapped to add its wall-clock time to `section`.
+        '''
+        times, calls = self.times, self.calls
+        perf_counter = time.perf_counter
+
+        def wrapper():
+            start = perf_counter()
+            value = function()
+            times[section] += perf_counter() - start
+            calls[section] += 1
+            return value
+        return wrapper
+
+
+    def inter_arrivals(self, next_inter_arrival):
+        '''
+        Returns timed `next_inter_arrival` that also keeps the simulated clock
+        (each engine draws it once per arrival, at the arrival) and takes a
+        sample every `sample_every` arrivals.
+        '''
+        next_inter_arrival = self.timed('variates', next_inter_arrival)
+        sample_every = self.sample_every
+        perf_counter = time.perf_counter
+        n = 0
+
+        def wrapper():
+            nonlocal n
+            if n % sample_every == 0:
+                self.samples.append((self.clock, perf_counter() - self.start, self.queue_length))
+            n += 1
+            value = next_inter_arrival()
+            self.clock += value
+            return value
+        return wrapper
+
+
+    @contextmanager
+    def section(self, name):
+        '''
+        Adds the wall-clock time of the enclosed block to section `name`.
+        '''
+        start = time.perf_counter()
+        yield
+        self.times[name] += time.perf_counter() - start
+
+
+    def begin(self, simulation):
+        '''
+        Starts profiling `simulation`. For the Python event-loop engines, swaps
+        in timed random streams and logging (restored by `end`).
+        '''
+        self.engine = simulation.engine
+        self.start = time.perf_counter()
+        if simulation.engine in ARRAY_ENGINES:
+            return
+        self._saved = simulation.next_inter_arrival, simulation.next_service, simulation.stream
+        simulation.next_inter_arrival = self.inter_arrivals(simulation.next_inter_arrival)
+        simulation.next_service = self.timed('variates', simulation.next_service)
+        simulation.stream = ProfiledLog(self, simulation, simulation.stream)
+
+
+    def end(self, simulation):
+        '''
+        Stops profiling `simulation` and collects event counts and times.
+        Departures are the service starts minus the customers still in service.
+        '''
+        self.wall_time = time.perf_counter() - self.start
+        self.simulated_time = simulation.now
+        if simulation.engine not in ARRAY_ENGINES:
+            simulation.next_inter_arrival, simulation.next_service, simulation.stream = self._saved
+            del self._saved
+
+        state = simulation.state
+        self.events['arrival'] = int(simulation.n_queue_lengths)
+        self.events['service start'] = int(simulation.n_waiting_times)
+        self.events['departure'] = int(simulation.n_waiting_times - (state.in_system - state.in_queue))
+
+        # Charge the cost of the timers to instrumentation instead of the sections:
+        n_calls = sum(self.calls.values())
+        recorded, total = timer_overhead() if n_calls else (0.0, 0.0)
+        for name, calls in self.calls.items():
+            self.times[name] = max(0.0, self.times[name] - recorded * calls)
+        self.times['instrumentation'] = n_calls * total
+        self.times['scheduling'] = max(0.0, self.wall_time - sum(self.times[name] for name in ('variates', 'logging', 'instrumentation')))
+
+
+    def report(self):
+        '''
+        Returns the profile as a dict, see `QueueSimulation.get_profile`.
+        '''
+        n_events = sum(self.events.values())
+        return {
+            'engine': self.engine,
+            'events': dict(self.events),
+            'wall time': self.wall_time,
+            'simulated time': self.simulated_time,
+            'wall time per simulated time': self.wall_time / self.simulated_time if self.simulated_time else np.nan,
+            'events per second': n_events / self.wall_time if self.wall_time else np.nan,
+            'time': dict(self.times),
+            'samples': np.array(self.samples, dtype=float).reshape(-1, 3),
+        }
+
+
+def format_profile(profile, rows=10):
+    """
+    Returns a printable summary of `QueueSimulation.get_profile()`, with at most
+    `rows` of the samples: wall-clock time per simulated time unit since the
+    previous row, next to the queue length.
+    """
+    lines = [
+        f"PROFILE ({profile['engine']} engine)",
+        "Events: " + ", ".join(f"{count} {name}s" for name, count in profile['events'].items()),
+        f"Wall time: {profile['wall time']:.3f} s for {profile['simulated time']:.1f} simulated time units "
+        f"({profile['wall time per simulated time'] * 1e6:.1f} us per unit, {profile['events per second']:.0f} events/s)",
+    ]
+    for name, seconds in profile['time'].items():
+        lines.append(f"{name:>16}: {seconds:8.3f} s ({seconds / profile['wall time']:6.1%})")
+
+    samples = profile['samples']
+    if samples.shape[0] > 1:
+        lines.append(f"{'simulated time':>16} {'wall time (s)':>14} {'us per unit':>12} {'queue length':>13}")
+        rows = np.unique(np.linspace(0, samples.shape[0] - 1, rows + 1).astype(int))
+        previous = samples[0]
+        for sim_time, wall_time, queue_length in samples[rows]:
+            rate = (wall_time - previous[1]) / (sim_time - previous[0]) * 1e6 if sim_time > previous[0] else np.nan
+            lines.append(f"{sim_time:>16.1f} {wall_time:>14.3f} {rate:>12.1f} {queue_length:>13.0f}")
+            previous = sim_time, wall_time
+    return "\n".join(lines)
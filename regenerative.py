@@ -0,0 +1,107 @@
+'''
+Regenerative (busy-cycle) estimation for heavy-traffic runs.
+
+Each time a customer arrives at an empty system, the queue starts afresh
+independently of its past. A run therefore splits at these arrivals into
+independent, identically distributed busy cycles: a busy period followed by
+the idle period after it. Every run starts with an arrival at an empty
+system, so every complete cycle counts and no warm-up is dropped. Long-run
+averages are ratios of cycle sums, f.e. the total waiting time over the
+number of customers per cycle, with confidence intervals from
+`estimators.ratio_ci`. Cycles of independent runs are independent as well,
+so cycles are simulated in parallel by running one segment per seed on
+worker processes and pooling the cycles of all segments.
+'''
+
+import numpy as np
+
+from Queue import QueueSimulation, customer_times
+from estimators import ratio_ci
+
+CYCLE_FIELDS = ('customers', 'wait', 'queue length', 'sojourn', 'length')
+
+
+def busy_cycles(customers):
+    '''
+    Description
+    -----------
+    Splits a per-customer trace (`CUSTOMER_DTYPE`, in arrival order) at the
+    arrivals that find the system empty and returns the sums over each
+    complete cycle. The last cycle, cut off by the end of the run, is dropped.
+
+    Returns
+    -------
+    dict of `np.ndarray` with one value per cycle: the number of 'customers',
+    the sums of their 'wait', 'queue length' at arrival and 'sojourn' time,
+    and the 'length' of the cycle in time.
+    '''
+
+    arrival = customers['arrival']
+    wait = customers['wait'].astype(float)
+    _, departure = customer_times(customers)
+    # customers that did not start service by the end of the run never depart:
+    departure = np.where(np.isnan(departure), np.inf, departure)
+
+    # Customer i arrives at an empty system if all earlier customers departed
+    # (it is then served at once, which also guards against the float32
+    # rounding of the waiting and service times in the trace):
+    regenerations = np.flatnonzero((arrival[1:] >= np.maximum.accumulate(departure[:-1])) & (wait[1:] == 0)) + 1
+    boundaries = np.concatenate(([0], regenerations)) if arrival.size else regenerations
+    starts, ends = boundaries[:-1], boundaries[1:]
+    if not starts.size:
+        return {field: np.zeros(0) for field in CYCLE_FIELDS}
+
+    complete = slice(0, ends[-1])
+    return {
+        'customers': ends - starts,
+        'wait': np.add.reduceat(wait[complete], starts),
+        'queue length': np.add.reduceat(customers['queue_length'][complete].astype(float), starts),
+        'sojourn': np.add.reduceat(wait[complete] + customers['service'][complete], starts),
+        'length': arrival[ends] - arrival[starts],
+    }
+
+
+def simulate_cycles(seed, n_servers, discipline, service_rate, arrival_rate, max_customers, max_runtime, B="M", engine="native"):
+    '''
+    Runs one segment of at most `max_customers` customers on its own `seed`
+    and returns its `busy_cycles`.
+    '''
+    simulation = QueueSimulation(
+        n_servers, discipline, service_rate, arrival_rate, max_customers, max_runtime, seed=seed, B=B, engine=engine,
+        trace_points=0, customer_trace=True
+    )
+    simulation.run()
+    return busy_cycles(simulation.customers)
+
+
+def pool_cycles(segments):
+    '''
+    Returns the cycles of all `segments` (results of `simulate_cycles`) as one set of cycles.
+    '''
+    return {field: np.concatenate([cycles[field] for cycles in segments]) for field in CYCLE_FIELDS}
+
+
+def segment_averages(segments):
+    '''
+    Returns arrays of the average waiting time and queue length over the complete
+    cycles of each segment (NaN for a segment without a complete cycle).
+    '''
+    customers = np.array([cycles['customers'].sum() for cycles in segments], dtype=float)
+    with np.errstate(invalid='ignore'):
+        avg_waiting_times = np.array([cycles['wait'].sum() for cycles in segments]) / customers
+        avg_queue_lengths = np.array([cycles['queue length'].sum() for cycles in segments]) / customers
+    return avg_waiting_times, avg_queue_lengths
+
+
+def cycle_estimates(cycles, confidence=0.95):
+    '''
+    Returns dict with value: (ratio estimate, CI half-width) of the customer averages
+    (per customer in a cycle) and time averages (per time unit of a cycle).
+    '''
+    return {
+        "Average waiting time": ratio_ci(cycles['wait'], cycles['customers'], confidence),
+        "Average queue length": ratio_ci(cycles['queue length'], cycles['customers'], confidence),
+        "Average sojourn time": ratio_ci(cycles['sojourn'], cycles['customers'], confidence),
+        "Time-average number in queue": ratio_ci(cycles['wait'], cycles['length'], confidence),
+        "Time-average number in system": ratio_ci(cycles['sojourn'], cycles['length'], confidence),
+    }
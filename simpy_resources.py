@@ -0,0 +1,21 @@
+'''
+SimPy resources used by the SimPy engine of `QueueSimulation`. Kept apart
+from `Queue`, so that SimPy is only imported when that engine runs.
+'''
+
+import simpy
+from functools import partial
+from operator import attrgetter
+
+from Queue import HeapQueue
+
+
+class HeapPriorityResource(simpy.PriorityResource):
+
+    '''
+    `simpy.PriorityResource` whose waiting requests are kept in a `HeapQueue`
+    instead of a list that is re-sorted on every request. Requests are
+    ordered on the same key (priority, request time, preemption flag).
+    '''
+
+    PutQueue = partial(HeapQueue, key=attrgetter('key'))
@@ -49,8 +49,8 @@ def avg_waiting_times(n_servers, max_iterations):
             mean_arrival_rate= arrival_rate,
             max_customers= max_customers,
             max_runtime= 10_000,
-            seed= None,
-            B= 'M'
+            B= 'M',
+            streams= CommonRandomNumbers(i, max_customers)  # iteration i sees the same randomness for every n
         )
 
         MMn.run()
@@ -0,0 +1,385 @@
+'''
+Streaming (online) statistics with O(1) memory, so long simulations
+do not have to keep every waiting time and queue length.
+'''
+
+import math
+import numpy as np
+
+
+class RunningStats:
+
+    '''
+    Running count, mean, variance (Welford), minimum and maximum.
+    '''
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.M2 = 0.0  # sum of squared deviations from the mean
+        self.min = math.inf
+        self.max = -math.inf
+
+
+    def update(self, x):
+        '''
+        Adds a single observation.
+        '''
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.M2 += delta * (x - self.mean)
+        if x < self.min: self.min = x
+        if x > self.max: self.max = x
+
+
+    def update_array(self, xs):
+        '''
+        Adds an array of observations at once.
+        '''
+        xs = np.asarray(xs, dtype=float)
+        if xs.size:
+            other = RunningStats()
+            other.n, other.mean = xs.size, xs.mean()
+            other.M2 = np.sum((xs - other.mean)**2)
+            other.min, other.max = xs.min(), xs.max()
+            self.merge(other)
+
+
+    def merge(self, other):
+        '''
+        Combines the statistics of `other` into these (Chan et al.).
+        '''
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.M2 += other.M2 + delta**2 * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+
+    @property
+    def var(self):
+        '''
+        Population variance (as `np.var`), NaN without observations.
+        '''
+        return self.M2 / self.n if self.n else math.nan
+
+
+    @property
+    def sample_var(self):
+        '''
+        Sample variance (ddof=1), NaN with fewer than two observations.
+        '''
+        return self.M2 / (self.n - 1) if self.n > 1 else math.nan
+
+
+    def ci_half_width(self, confidence=0.95):
+        '''
+        Half-width of the Student-t confidence interval of the mean,
+        infinite with fewer than two observations.
+        '''
+        if self.n < 2:
+            return math.inf
+        from scipy.stats import t
+        return t.ppf(0.5 + confidence / 2, self.n - 1) * math.sqrt(self.sample_var / self.n)
+
+
+class QuantileSketch:
+
+    '''
+    Quantile sketch on logarithmic buckets: any quantile of the non-negative
+    observations is returned within a relative error `alpha`. Exact zeros
+    (customers that do not wait) get their own bucket. The number of buckets
+    is capped at `max_buckets` by merging the lowest ones, which keeps
+    memory bounded no matter how many observations are added.
+    '''
+
+    def __init__(self, alpha=0.01, max_buckets=2048):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.zeros = 0
+        self.buckets = {}  # bucket index: count
+        self.n = 0
+
+
+    def update(self, x):
+        '''
+        Adds a single observation.
+        '''
+        self.n += 1
+        if x <= 0:
+            self.zeros += 1
+            return
+        i = math.ceil(math.log(x) / self.log_gamma)
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+        if len(self.buckets) > self.max_buckets:
+            self.collapse()
+
+
+    def update_array(self, xs):
+        '''
+        Adds an array of observations at once.
+        '''
+        xs = np.asarray(xs, dtype=float)
+        positive = xs[xs > 0]
+        self.n += xs.size
+        self.zeros += xs.size - positive.size
+        indices, counts = np.unique(np.ceil(np.log(positive) / self.log_gamma).astype(int), return_counts=True)
+        for i, count in zip(indices.tolist(), counts.tolist()):
+            self.buckets[i] = self.buckets.get(i, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self.collapse()
+
+
+    def collapse(self):
+        '''
+        Merges the lowest buckets until at most `max_buckets` remain.
+        '''
+        indices = sorted(self.buckets)
+        excess = len(indices) - self.max_buckets
+        target = indices[excess]
+        for i in indices[:excess]:
+            self.buckets[target] += self.buckets.pop(i)
+
+
+    def quantile(self, q):
+        '''
+        Returns the `q`-quantile (0 <= q <= 1), NaN without observations.
+        '''
+        if self.n == 0:
+            return math.nan
+        rank = q * (self.n - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if seen > rank:
+                return 2 * self.gamma**i / (self.gamma + 1)
+        return 2 * self.gamma**max(self.buckets) / (self.gamma + 1)
+
+
+class BatchMeans:
+
+    '''
+    Streaming batch means of a single long run, with bounded memory.
+    Observations are averaged in batches of `batch_size` (initially 5, as in
+    MSER-5); once `max_batches` batches exist, adjacent pairs are merged and
+    the batch size doubles. The warm-up is removed with the MSER rule applied
+    to the batch means before forming a confidence interval.
+    '''
+
+    def __init__(self, batch_size=5, max_batches=1024):
+        self.batch_size = batch_size
+        self.max_batches = max_batches  # must be even
+        self.means = []
+        self.sum = 0.0  # of the current, incomplete batch
+        self.count = 0
+
+
+    def push(self, mean):
+        '''
+        Adds a complete batch, merging pairs of batches if full.
+        '''
+        self.means.append(mean)
+        if len(self.means) == self.max_batches:
+            means = np.array(self.means)
+            self.means = ((means[0::2] + means[1::2]) / 2).tolist()
+            self.batch_size *= 2
+
+
+    def update(self, x):
+        '''
+        Adds a single observation.
+        '''
+        self.sum += x
+        self.count += 1
+        if self.count == self.batch_size:
+            self.push(self.sum / self.batch_size)
+            self.sum, self.count = 0.0, 0
+
+
+    def update_array(self, xs):
+        '''
+        Adds an array of observations at once.
+        '''
+        xs = np.asarray(xs, dtype=float)
+
+        # Complete the current batch:
+        head, xs = xs[:self.batch_size - self.count], xs[self.batch_size - self.count:]
+        self.sum += head.sum()
+        self.count += head.size
+        if self.count < self.batch_size:
+            return
+        self.push(self.sum / self.batch_size)
+        self.sum, self.count = 0.0, 0
+
+        # Full batches, up to the next merge at a time:
+        while xs.size >= self.batch_size:
+            k = min(xs.size // self.batch_size, self.max_batches - len(self.means))
+            full, xs = xs[:k * self.batch_size], xs[k * self.batch_size:]
+            means = full.reshape(k, self.batch_size).mean(axis=1).tolist()
+            self.means += means[:-1]
+            self.push(means[-1])
+
+        self.sum, self.count = xs.sum(), xs.size
+
+
+    def mser_truncation(self):
+        '''
+        Returns the number of batches d to drop as warm-up, minimizing the
+        MSER statistic sum_{j>=d} (Z_j - mean(Z_d..))^2 / (k - d)^2 over d <= k/2.
+        '''
+        Z = np.array(self.means)
+        k = Z.size
+        if k < 2:
+            return 0
+        S1 = np.cumsum(Z[::-1])[::-1]  # suffix sums
+        S2 = np.cumsum(Z[::-1]**2)[::-1]
+        n = k - np.arange(k)
+        mser = (S2 - S1**2 / n) / n**2
+        return int(np.argmin(mser[:k // 2 + 1]))
+
+
+    def batches(self, n_batches=20, truncation=None):
+        '''
+        Returns the batch means after dropping `truncation` batches (MSER
+        if None), regrouped into at most `n_batches` equal batches. The
+        oldest leftover batch means are dropped.
+        '''
+        d = self.mser_truncation() if truncation is None else truncation
+        Z = np.array(self.means[d:])
+        n_batches = min(n_batches, Z.size)
+        if n_batches == 0:
+            return Z
+        return Z[Z.size % n_batches:].reshape(n_batches, -1).mean(axis=1)
+
+
+    def confidence_interval(self, n_batches=20, confidence=0.95):
+        '''
+        Description
+        -----------
+        Returns (mean, CI half-width, observations dropped as warm-up).
+        The regrouped batches (see `batches`) are treated as independent
+        observations in a Student-t interval.
+        '''
+        from scipy.stats import t
+
+        d = self.mser_truncation()
+        batches = self.batches(n_batches, d)
+        if batches.size < 2:
+            return (batches.mean() if batches.size else math.nan), math.inf, d * self.batch_size
+
+        half_width = t.ppf(0.5 + confidence / 2, batches.size - 1) * batches.std(ddof=1) / math.sqrt(batches.size)
+        return batches.mean(), half_width, d * self.batch_size
+
+
+class TimeWeightedState:
+
+    '''
+    Time-weighted number of customers in the system and in the queue.
+    The state is piecewise constant between events, so its time averages
+    are kept as integrals (areas) that are updated at every event. The
+    number in system can also be traced at `trace_points` equally spaced
+    times in [0, horizon), instead of at every state change (not with an
+    infinite horizon).
+    '''
+
+    def __init__(self, horizon, trace_points=0):
+        if not math.isfinite(horizon):
+            trace_points = 0
+        self.time = 0.0
+        self.in_system = 0
+        self.in_queue = 0
+        self.area_system = 0.0
+        self.area_queue = 0.0
+
+        self.trace_interval = horizon / trace_points if trace_points else math.inf
+        self.t = np.full(trace_points, np.NaN)
+        self.N_t = np.full(trace_points, np.NaN)
+        self.n_trace = 0
+        self.next_trace = 0.0 if trace_points else math.inf
+
+
+    def advance(self, now):
+        '''
+        Integrates the current state up to time `now`.
+        '''
+        dt = now - self.time
+        self.area_system += dt * self.in_system
+        self.area_queue += dt * self.in_queue
+        if self.next_trace < now:
+            self.next_trace = self.trace(now, self.in_system)
+        self.time = now
+
+
+    def trace(self, now, in_system):
+        '''
+        Records `in_system` at all untraced times before `now`, returns the next trace time.
+        '''
+        n = min(self.t.size, math.ceil(now / self.trace_interval))
+        self.t[self.n_trace:n] = np.arange(self.n_trace, n) * self.trace_interval
+        self.N_t[self.n_trace:n] = in_system
+        self.n_trace = n
+        return n * self.trace_interval if n < self.t.size else math.inf
+
+
+    @property
+    def mean_in_system(self):
+        return self.area_system / self.time if self.time else math.nan
+
+
+    @property
+    def mean_in_queue(self):
+        return self.area_queue / self.time if self.time else math.nan
+
+
+class StreamingMetrics:
+
+    '''
+    Online summary of waiting times and queue lengths of one simulation.
+    '''
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, alpha=0.01):
+        self.waiting_times = RunningStats()
+        self.queue_lengths = RunningStats()
+        self.waiting_time_sketch = QuantileSketch(alpha)
+        self.waiting_time_batches = BatchMeans()
+        self.queue_length_batches = BatchMeans()
+
+
+    def add_waiting_time(self, x):
+        self.waiting_times.update(x)
+        self.waiting_time_sketch.update(x)
+        self.waiting_time_batches.update(x)
+
+
+    def add_queue_length(self, x):
+        self.queue_lengths.update(x)
+        self.queue_length_batches.update(x)
+
+
+    def add_arrays(self, waiting_times, queue_lengths):
+        '''
+        Adds arrays of waiting times and queue lengths at once.
+        '''
+        self.waiting_times.update_array(waiting_times)
+        self.waiting_time_sketch.update_array(waiting_times)
+        self.waiting_time_batches.update_array(waiting_times)
+        self.queue_lengths.update_array(queue_lengths)
+        self.queue_length_batches.update_array(queue_lengths)
+
+
+    def waiting_time_quantiles(self):
+        '''
+        Returns {q: waiting time quantile} for q in `QUANTILES` (P50/P95/P99).
+        '''
+        return {q: self.waiting_time_sketch.quantile(q) for q in self.QUANTILES}
@@ -0,0 +1,177 @@
+'''
+Runs a grid of queueing system configurations in one process pool.
+Replaces the per-lambda loops in `bash_scripts/`: every (configuration, seed chunk)
+is scheduled on the same pool and each configuration is saved, under the same
+`averages_*` name as `main.py --save`, as soon as all its replications are done.
+Configurations whose output file already exists are skipped, so an interrupted
+sweep resumes where it left off.
+
+A grid maps each parameter to a value or a list of values; all combinations are run.
+Grids are read from a JSON file (a grid or a list of grids, see `sweeps/`) or built
+from the command line, e.g.
+
+    python3 sweep.py sweeps/all_sims.json -w 32
+    python3 sweep.py -q MM4 -l 0.4 1.6 3.2 -m 2 -n 250 -t 100000 -c 10000 -w 32
+'''
+
+import numpy as np
+from Queue import service_time_moments
+from main import replication_tasks
+from cache import CACHE_DIR, code_version
+from erlang import mgc_metrics
+from helpers import error_message, averages_title, utilization
+from writers import get_writer
+from collections import defaultdict
+from itertools import product
+import multiprocessing
+import argparse
+import json
+import os
+
+GRID_DEFAULTS = {
+    "queue_system": "MM1",
+    "arrival_rate": 0.9,
+    "service_rate": 1,
+    "discipline": "FIFO",
+    "n": 250,
+    "run_time": 10**4,
+    "customers": 10**5,
+    "engine": "native",
+}
+SATURATION = 0.95  # configurations loaded at least this much are flagged
+
+
+def expand_grid(grid):
+    """
+    Returns a list of configurations (dicts) for all combinations of values in `grid`.
+    """
+    grid = {**GRID_DEFAULTS, **grid}
+    keys = list(grid)
+    values = [v if isinstance(v, list) else [v] for v in grid.values()]
+    return [dict(zip(keys, combination)) for combination in product(*values)]
+
+
+def run_chunk(job):
+    """
+    Runs one chunk of seeds of configuration `index`, returns (index, seeds, results).
+    """
+    index, task, seeds = job
+    return index, seeds, task(seeds)
+
+
+def sweep(grids, output_dir="./data/simulation_averages/", workers=1, force=False, cache_dir=None, output_format="csv"):
+    """
+    Description
+    -----------
+    Runs all configurations of `grids` on a pool of `workers` processes
+    and saves the averages of each configuration to `output_dir`.
+
+    Parameters
+    ----------
+    grids : `list` of `dict`
+        Grids of parameters, see `expand_grid`.
+    output_dir : `str`
+        Directory for the `averages_*` files.
+    workers : `int`
+        Number of worker processes.
+    force : `bool`
+        Rerun configurations whose output already exists.
+    cache_dir : `str`
+        Directory of the result cache, None to disable it.
+    output_format : `str`
+        Format of the output files ('csv', 'npz' or 'parquet').
+    """
+
+    configs = [config for grid in grids for config in expand_grid(grid)]
+    os.makedirs(output_dir, exist_ok=True)
+    writer = get_writer(output_format)
+    jobs, paths, todo, metadata = [], {}, {}, {}
+
+    for index, config in enumerate(configs):
+        error = error_message(argparse.Namespace(
+            **config, workers=workers, format=output_format, save_raw=False, streaming=False,
+            target_ci=None, confidence=0.95, long_run=False, regenerative=False, antithetic=False, customer_trace=False
+            ))
+        if error:
+            print(f"Skipping {config}: {error}")
+            continue
+
+        c = int(config["queue_system"][2])
+        rho = config["arrival_rate"] / (c * config["service_rate"])
+        title = averages_title(config["queue_system"], config["n"], rho, config["run_time"], config["discipline"], writer.extension)
+        path = os.path.join(output_dir, title)
+        if os.path.exists(path) and not force:
+            print(f"Skipping {title}: already exists")
+            continue
+
+        task, chunks = replication_tasks(
+            config["queue_system"], config["n"], config["arrival_rate"], config["service_rate"], config["run_time"],
+            config["customers"], config["discipline"], save_raw=False, engine=config["engine"], workers=workers,
+            cache_dir=cache_dir
+            )
+        jobs += [(index, task, chunk) for chunk in chunks]
+        paths[index], todo[index] = path, len(chunks)
+        # Analytic prediction (M/M/c, Pollaczek-Khinchine or Allen-Cunneen), inf if unstable:
+        mean, scv = service_time_moments(config["queue_system"][1], config["service_rate"])
+        expected_wait = float(mgc_metrics(config["arrival_rate"], mean, scv, c)["expected waiting time"])
+        load = utilization(config["queue_system"][1], config["arrival_rate"], config["service_rate"], c)
+        metadata[index] = {**config, "rho": rho, "utilization": load, "expected_waiting_time": expected_wait, "code_version": code_version()}
+        if load >= SATURATION:
+            print(f"Near saturation (utilization {load:.3f}, expected waiting time {expected_wait:.1f}): {title}")
+
+    # Start with the most heavily loaded configurations, whose replications have the
+    # longest queues and most variable run times (stable sort, seeds stay in order):
+    jobs.sort(key=lambda job: -metadata[job[0]]["expected_waiting_time"])
+
+    print(f"Running {len(paths)} configurations ({len(jobs)} jobs) on {workers} worker(s)")
+    results = defaultdict(dict)
+
+    with multiprocessing.Pool(workers) as pool:
+        for index, seeds, chunk in pool.imap_unordered(run_chunk, jobs):
+            results[index].update(zip(seeds, chunk))
+            todo[index] -= 1
+
+            # Save configuration once all its seeds are in, ordered by seed:
+            if todo[index] == 0:
+                by_seed = results.pop(index)
+                averages = [by_seed[seed] for seed in range(configs[index]["n"])]
+                avg_waiting_times = np.array([avg_wait for avg_wait, *_ in averages])
+                avg_queue_lengths = np.array([avg_length for _, avg_length, *_ in averages])
+                writer.write_averages(paths[index], avg_waiting_times, avg_queue_lengths, metadata[index])
+                print(f"Output saved to {os.path.basename(paths[index])}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a grid of queueing system simulations")
+
+    parser.add_argument("grid_files", nargs="*", help="JSON file(s) with a grid or list of grids")
+    parser.add_argument("-q", "--queue_system", nargs="+", help="queueing system(s) in kendall notation, f.e. MM1")
+    parser.add_argument("-l", "--arrival_rate", nargs="+", type=float, help="mean arrival rate(s) (lambda)")
+    parser.add_argument("-m", "--service_rate", nargs="+", type=float, help="mean service rate(s) (mu)")
+    parser.add_argument("-d", "--discipline", nargs="+", help="queue discipline(s) (FIFO or SJF)")
+    parser.add_argument("-n", nargs="+", type=int, help="number(s) of simulations per configuration")
+    parser.add_argument("-t", "--run_time", nargs="+", type=int, help="max run_time used per simulation")
+    parser.add_argument("-c", "--customers", nargs="+", type=int, help="max customers arriving in one simulation")
+    parser.add_argument("-e", "--engine", help="simulation engine (simpy, native or vectorized)")
+    parser.add_argument("-w", "--workers", help="number of worker processes", default=os.cpu_count(), type=int)
+    parser.add_argument("-o", "--output", help="output directory", default="./data/simulation_averages/")
+    parser.add_argument("-f", "--format", help="output file format (csv, npz or parquet)", default="csv")
+    parser.add_argument("--force", action="store_true", help="rerun configurations whose output exists")
+    parser.add_argument("--cache", nargs="?", const=CACHE_DIR, help="reuse per-replication results cached in this directory (default %(const)s)")
+
+    args = parser.parse_args()
+
+    grids = []
+    for grid_file in args.grid_files:
+        with open(grid_file) as f:
+            grid = json.load(f)
+        grids += grid if isinstance(grid, list) else [grid]
+
+    # Command line grid (also overrides the keys of file grids):
+    cli_grid = {key: value for key, value in vars(args).items() if key in GRID_DEFAULTS and value is not None}
+    if grids:
+        grids = [{**grid, **cli_grid} for grid in grids]
+    else:
+        grids = [cli_grid]
+
+    sweep(grids, args.output, args.workers, args.force, args.cache, args.format)
@@ -0,0 +1,57 @@
+'''
+Checks the size accounting and LRU eviction of the on-disk `ResultCache`,
+and that its keys depend on the parameters and the code version.
+'''
+
+import os
+import cache
+from cache import ResultCache, simulation_params
+
+
+def params(seed, **kwargs):
+    return simulation_params(1, "FIFO", 1.0, 0.9, 1000, float("inf"), seed, "M", "native", **kwargs)
+
+
+def disk_size(result_cache):
+    return sum(size for _, size, _ in result_cache.entries())
+
+
+def test_overwriting_an_entry_keeps_the_size(tmp_path):
+    result_cache = ResultCache(str(tmp_path))
+    for value in [(1.0, 2.0, 3, 4), (1.5, 2.5, 3, 4), (1.25, 2.25, 3, 4)]:
+        result_cache.put(params(0), value)
+    assert result_cache.size == disk_size(result_cache)
+    assert ResultCache(str(tmp_path)).get(params(0)) == (1.25, 2.25, 3, 4)
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    result_cache = ResultCache(str(tmp_path), max_bytes=10**6)
+    for seed in range(10):
+        result_cache.put(params(seed), (float(seed), 1.0, 100, 100))
+        os.utime(result_cache.path(result_cache.key(params(seed))), (seed, seed))  # put in order
+    entry_size = disk_size(result_cache) / 10
+
+    # a lookup from a new process (no memory layer) marks seed 0 as recently used:
+    assert ResultCache(str(tmp_path)).get(params(0)) == (0.0, 1.0, 100, 100)
+
+    result_cache.max_bytes = int(10.5 * entry_size)
+    result_cache.put(params(10), (10.0, 1.0, 100, 100))
+    assert result_cache.size == disk_size(result_cache) <= 0.9 * result_cache.max_bytes
+
+    fresh = ResultCache(str(tmp_path))
+    kept = [seed for seed in range(11) if fresh.get(params(seed)) is not None]
+    assert kept == [0, 3, 4, 5, 6, 7, 8, 9, 10]  # 9 entries are at most 90% of the cap
+
+
+def test_key_depends_on_code_version_and_params(tmp_path, monkeypatch):
+    result_cache = ResultCache(str(tmp_path))
+    result_cache.put(params(0), (1.0, 2.0, 3, 4))
+    keys = {result_cache.key(p) for p in (params(0), params(1), params(0, streams="crn"), params(0, streaming=True))}
+    assert len(keys) == 4
+
+    # results of other simulation code are not returned:
+    monkeypatch.setattr(cache, "code_version", lambda: "other version")
+    assert ResultCache(str(tmp_path)).get(params(0)) is None
+    monkeypatch.undo()
+    assert ResultCache(str(tmp_path)).get(params(0)) == (1.0, 2.0, 3, 4)
+
@@ -0,0 +1,19 @@
+'''
+Checks that the simulated capacity search of `capacity` returns the analytic
+answer for M/M/c FIFO, where the analytic waiting-time quantile is exact.
+'''
+
+import pytest
+
+from capacity import CapacitySearch
+
+
+@pytest.mark.parametrize("arrival_rate, sla, n_servers", [(3.6, 2.0, 5), (3.6, 0.5, 7)])
+def test_min_servers_matches_analytic_mmc(arrival_rate, sla, n_servers):
+    search = CapacitySearch("M", 1.0, sla, quantile=0.95, max_customers=5000)
+    assert search.analytic_min_servers(arrival_rate) == n_servers
+    assert search.min_servers(arrival_rate) == n_servers
+
+    # the answer meets the SLA and one server less does not:
+    decisions = {servers: meets for servers, _, _, _, _, meets in search.evaluations}
+    assert decisions == {n_servers: True, n_servers - 1: False}
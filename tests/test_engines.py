@@ -0,0 +1,68 @@
+'''
+Checks that every engine of `QueueSimulation` reproduces the logs of the
+SimPy engine for the same seed. Run from the repository root with `python3 -m pytest tests`.
+'''
+
+import importlib.util
+import numpy as np
+import pytest
+
+from Queue import QueueSimulation
+from Metrics import QueueMetrics
+
+SEEDS = (0, 7)
+MAX_CUSTOMERS = 2000
+ENGINES = [
+    "native",
+    "vectorized",
+    pytest.param("jit", marks=pytest.mark.skipif(importlib.util.find_spec("numba") is None, reason="numba is not installed")),
+]
+
+
+def run_log(engine, n_servers, discipline, B, seed, max_runtime):
+    simulation = QueueSimulation(
+        n_servers, discipline, 1.0, 0.9 * n_servers, MAX_CUSTOMERS, max_runtime, seed=seed, B=B, engine=engine
+    )
+    simulation.run()
+    return simulation.get_log()
+
+
+@pytest.mark.parametrize("max_runtime", [np.inf, 500.0])
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("discipline", ["FIFO", "SJF"])
+@pytest.mark.parametrize("n_servers", [1, 2])
+@pytest.mark.parametrize("B", ["M", "D", "H"])
+@pytest.mark.parametrize("engine", ENGINES)
+def test_engine_matches_simpy(engine, B, n_servers, discipline, seed, max_runtime):
+    if engine == "vectorized" and discipline != "FIFO":
+        pytest.skip("the vectorized engine only supports FIFO")
+
+    expected_waits, expected_lengths = run_log("simpy", n_servers, discipline, B, seed, max_runtime)
+    waiting_times, queue_lengths = run_log(engine, n_servers, discipline, B, seed, max_runtime)
+
+    np.testing.assert_array_equal(queue_lengths, expected_lengths)
+    if engine == "vectorized":
+        # the Lindley recursion sums the same times in a different order
+        np.testing.assert_allclose(waiting_times, expected_waits, rtol=0, atol=1e-9)
+    else:
+        np.testing.assert_array_equal(waiting_times, expected_waits)
+
+
+@pytest.mark.parametrize("max_runtime", [np.inf, 500.0])
+@pytest.mark.parametrize("engine", ENGINES)
+def test_customer_metrics_match_simpy(engine, max_runtime):
+    # the end of the run (the last departure with an infinite horizon) and so the
+    # server utilization of the customer trace are the same on every engine
+    simulations = {}
+    for name in ("simpy", engine):
+        simulations[name] = QueueSimulation(2, "FIFO", 1.0, 1.8, MAX_CUSTOMERS, max_runtime, seed=3, engine=name, customer_trace=True)
+        simulations[name].run()
+
+    assert simulations[engine].now == pytest.approx(simulations["simpy"].now)
+    assert np.isfinite(simulations["simpy"].now)
+
+    expected = QueueMetrics(simulations["simpy"]).get_customer_metrics()
+    metrics = QueueMetrics(simulations[engine]).get_customer_metrics()
+    assert np.all(expected["Server utilization"] > 0.5)
+    np.testing.assert_allclose(metrics["Server utilization"], expected["Server utilization"], rtol=1e-6)
+    assert metrics["Average sojourn time"] == pytest.approx(expected["Average sojourn time"], rel=1e-6)
@@ -0,0 +1,73 @@
+'''
+Checks the analytic M/M/c results of `erlang` (and the `helpers` that wrap them)
+against closed forms and a log-space reference, including unstable systems
+and hundreds of servers.
+'''
+
+import math
+import numpy as np
+import pytest
+
+import erlang
+import helpers
+
+
+def reference_mmc(c, a):
+    '''
+    Returns (p_0, Erlang-C) from the sums of a^k / k!, in log space.
+    '''
+    rho = a / c
+    log_terms = [k * math.log(a) - math.lgamma(k + 1) for k in range(c)]
+    log_terms.append(c * math.log(a) - math.lgamma(c + 1) - math.log(1 - rho))
+    largest = max(log_terms)
+    log_total = largest + math.log(sum(math.exp(term - largest) for term in log_terms))
+    return math.exp(-log_total), math.exp(log_terms[-1] - log_total)
+
+
+@pytest.mark.parametrize("rho", [0.1, 0.5, 0.9, 0.99])
+def test_mm1_closed_form(rho):
+    metrics = erlang.mmc_metrics(rho, 1.0, 1)
+    assert metrics["p_0"] == pytest.approx(1 - rho)
+    assert metrics["delay probability"] == pytest.approx(rho)
+    assert metrics["expected waiting time"] == pytest.approx(rho / (1 - rho))
+    assert metrics["expected queue length"] == pytest.approx(rho**2 / (1 - rho))
+
+
+@pytest.mark.parametrize("c, rho", [(2, 0.9), (10, 0.5), (100, 0.95), (500, 0.9), (500, 0.99), (1000, 0.999)])
+def test_large_c_matches_log_space_reference(c, rho):
+    a = c * rho
+    p_0, delay_prob = reference_mmc(c, a)
+    assert erlang.empty_probability(c, a) == pytest.approx(p_0, rel=1e-9)
+    assert erlang.erlang_c(c, a) == pytest.approx(delay_prob, rel=1e-9)
+    assert helpers.calc_p0(rho, c) == pytest.approx(p_0, rel=1e-9)
+    assert helpers.calc_exp_wait(rho, c, 1.0) == pytest.approx(delay_prob / (c * (1 - rho)), rel=1e-9)
+
+    # the vectorized path gives the same results as the scalar path
+    metrics = erlang.mmc_metrics(np.array([a]), 1.0, np.array([c]))
+    assert metrics["delay probability"][0] == pytest.approx(delay_prob, rel=1e-9)
+
+
+@pytest.mark.parametrize("c", [1, 2, 500])
+@pytest.mark.parametrize("rho", [1.0, 1.5])
+def test_unstable_systems(c, rho):
+    a = c * rho
+    with np.errstate(all="raise"):
+        assert erlang.empty_probability(c, a) == 0
+        assert erlang.erlang_c(c, a) == 1
+        metrics = erlang.mmc_metrics(a, 1.0, c)
+    assert metrics["p_0"] == 0
+    assert metrics["delay probability"] == 1
+    assert metrics["expected queue length"] == np.inf
+    assert metrics["expected waiting time"] == np.inf
+    assert helpers.calc_p0(rho, c) == 0
+
+    array_metrics = erlang.mmc_metrics(np.array([0.5 * c, a]), 1.0, c)
+    np.testing.assert_array_equal(array_metrics["expected waiting time"][1:], [np.inf])
+    assert np.isfinite(array_metrics["expected waiting time"][0])
+
+
+def test_waiting_time_quantile():
+    # M/M/1: P(W > t) = rho exp(-(mu - lambda) t)
+    assert erlang.waiting_time_quantile(0.95, 0.9, 1.0, 1.0, 1) == pytest.approx(math.log(0.9 / 0.05) / 0.1)
+    assert erlang.waiting_time_quantile(0.95, 0.01, 1.0, 1.0, 1) == 0
+    assert erlang.waiting_time_quantile(0.95, 1.0, 1.0, 1.0, 1) == np.inf
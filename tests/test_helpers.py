@@ -0,0 +1,33 @@
+'''
+Checks that the command line, the sweep and the capacity search share one
+stability check, on the actual mean service time of the distribution.
+'''
+
+import pytest
+
+import helpers
+from capacity import CapacitySearch
+from main import build_parser
+from Queue import service_time_moments
+
+
+@pytest.mark.parametrize("B", ["M", "D", "H"])
+def test_utilization_uses_mean_service_time(B):
+    mean, _ = service_time_moments(B, 2.0)
+    assert helpers.utilization(B, 3.0, 2.0, 4) == pytest.approx(3.0 * mean / 4)
+
+
+@pytest.mark.parametrize("queue_system, arrival_rate, stable", [
+    ("MM1", 0.9, True), ("MM1", 1.0, False), ("MH1", 1.2, True), ("MH1", 1.3, False), ("MD2", 1.9, True),
+])
+def test_cli_stability_check(queue_system, arrival_rate, stable):
+    args = build_parser().parse_args([queue_system, "10", "-l", str(arrival_rate)])
+    load = helpers.utilization(queue_system[1], arrival_rate, 1.0, int(queue_system[-1]))
+    assert (load < 1) == stable
+    assert (helpers.error_message(args) is None) == stable
+
+
+def test_capacity_search_skips_unstable_configurations():
+    search = CapacitySearch("H", 1.0, sla=1.0, max_customers=100)
+    assert not search.meets_sla(1, 1.3)
+    assert not search.evaluations  # rejected without simulating
@@ -0,0 +1,55 @@
+'''
+Checks the kernels of the 'jit' engine uncompiled, so they are tested without
+Numba: `kernels` is imported with a stand-in `numba` module whose `njit` returns
+the plain Python functions, and the logs must equal those of the native engine.
+'''
+
+import sys
+import types
+import numpy as np
+import pytest
+
+from Queue import QueueSimulation
+
+
+def njit(*args, **kwargs):
+    # `@njit` and `@njit(cache=True)` leave the function as is
+    if len(args) == 1 and callable(args[0]) and not kwargs:
+        return args[0]
+    return lambda function: function
+
+
+@pytest.fixture
+def uncompiled_kernels(monkeypatch):
+    monkeypatch.setitem(sys.modules, "numba", types.SimpleNamespace(njit=njit))
+    monkeypatch.delitem(sys.modules, "kernels", raising=False)
+    import kernels
+    yield kernels
+    # drop the uncompiled module, the compiled one (if any) is restored
+    sys.modules.pop("kernels", None)
+
+
+def run_simulation(engine, n_servers, discipline, B, max_runtime):
+    simulation = QueueSimulation(
+        n_servers, discipline, 1.0, 0.9 * n_servers, 2000, max_runtime, seed=5, B=B, engine="native", customer_trace=True
+    )
+    simulation.engine = engine  # run the jit engine even if Numba is not installed
+    simulation.run()
+    return simulation
+
+
+@pytest.mark.parametrize("max_runtime", [np.inf, 500.0])
+@pytest.mark.parametrize("discipline", ["FIFO", "SJF"])
+@pytest.mark.parametrize("n_servers", [1, 3])
+@pytest.mark.parametrize("B", ["M", "H"])
+def test_uncompiled_kernel_matches_native(uncompiled_kernels, B, n_servers, discipline, max_runtime):
+    expected = run_simulation("native", n_servers, discipline, B, max_runtime)
+    simulation = run_simulation("jit", n_servers, discipline, B, max_runtime)
+
+    assert not hasattr(uncompiled_kernels.event_loop, "py_func")  # really uncompiled
+    for log, expected_log in zip(simulation.get_log(), expected.get_log()):
+        np.testing.assert_array_equal(log, expected_log)
+    for field in expected.customers.dtype.names:  # unserved customers wait NaN
+        np.testing.assert_array_equal(simulation.customers[field], expected.customers[field])
+    assert simulation.now == expected.now
+    assert simulation.get_time_averages() == pytest.approx(expected.get_time_averages(), rel=1e-12)
@@ -0,0 +1,32 @@
+'''
+Checks the summary printed by `main.main` and the run parameters its metrics are built from.
+'''
+
+import re
+
+import main
+from Queue import QueueSimulation
+from Metrics import QueueMetrics
+
+
+def test_expected_metrics_from_run_parameters():
+    parameters = main.run_parameters("MH2", 1.5, 1.0, 1000.0, 500, "SJF", "native", seed=3)
+    simulation = QueueSimulation(2, "SJF", 1.0, 1.5, 500, 1000.0, seed=3, B="H", engine="native")
+    for name in ("n_servers", "discipline", "mean_service_rate", "mean_arrival_rate", "max_customers", "max_runtime", "seed", "B", "engine"):
+        assert getattr(parameters, name) == getattr(simulation, name), name
+    assert QueueMetrics(parameters).get_expected_metrics() == QueueMetrics(simulation).get_expected_metrics()
+
+
+def test_counts_are_summed_over_replications(capsys):
+    main.main("MM2", 3, 1.5, 1.0, 1000.0, 500, "FIFO", save=False, save_raw=False, engine="native")
+    output = capsys.readouterr().out
+
+    summaries = []
+    for seed in range(3):
+        simulation = QueueSimulation(2, "FIFO", 1.0, 1.5, 500, 1000.0, seed=seed, engine="native")
+        simulation.run()
+        summaries.append(simulation.get_summary())
+    n_wait = sum(summary[2] for summary in summaries)
+    n_queue = sum(summary[3] for summary in summaries)
+    assert re.search(r"n_wait: (\d+)", output).group(1) == str(n_wait)
+    assert re.search(r"n_queue: (\d+)", output).group(1) == str(n_queue)
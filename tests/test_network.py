@@ -0,0 +1,39 @@
+'''
+Checks `QueueNetwork` against the analytic (Jackson) results of
+`Metrics.NetworkMetrics`, and the end of runs that stop at `max_customers`.
+'''
+
+import numpy as np
+import pytest
+
+from Network import QueueNetwork, Station
+from Metrics import NetworkMetrics
+
+
+def test_jackson_network_matches_analytic():
+    # M/M/c stations with feedback, at loads of about 0.6, 0.4 and 0.3:
+    stations = [Station(1, 2.0), Station(2, 1.5), Station(1, 3.0)]
+    routing = [[0, 0.6, 0.3], [0, 0, 0.5], [0.2, 0, 0]]
+    network = QueueNetwork(stations, routing, [1.0, 0.5, 0.0], 10**5, np.inf, seed=0)
+    network.run()
+
+    metrics = NetworkMetrics(network)
+    expected = metrics.get_expected_network_metrics()
+    measured = metrics.get_measured_network_metrics()
+    assert measured["Time-average number in network"] == pytest.approx(expected["expected number in network"], rel=0.01)
+    assert measured["Average sojourn time"] == pytest.approx(expected["expected sojourn time"], rel=0.01)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_run_ends_at_last_departure(seed):
+    # Arrivals still pending at the second station after `max_customers` arrived
+    # must not move the clock past the last departure:
+    stations = [Station(1, 5.0), Station(1, 5.0)]
+    network = QueueNetwork(stations, np.zeros((2, 2)), [1.0, 0.05], 20, np.inf, seed=seed)
+    network.run()
+
+    assert network.n_departed == 20
+    assert network.now == np.max(network.entry_times + network.sojourn_times)
+    # with everyone gone, the area under the number in network is the sum of sojourn times:
+    in_system, _ = network.get_time_averages()
+    assert in_system.sum() * network.now == pytest.approx(network.get_sojourn_times().sum())
@@ -0,0 +1,34 @@
+'''
+Checks the profile of `QueueSimulation(..., profile=True)` runs.
+'''
+
+import numpy as np
+import pytest
+
+from Queue import QueueSimulation
+from profiling import format_profile
+
+
+@pytest.mark.parametrize("engine", ["simpy", "native"])
+def test_profile_infinite_horizon(engine):
+    simulation = QueueSimulation(1, "FIFO", 1.0, 0.9, 5000, np.inf, seed=0, engine=engine, profile=True)
+    simulation.run()
+    profile = simulation.get_profile()
+
+    # the simulated time is the last departure, not the infinite horizon
+    assert np.isfinite(profile["simulated time"])
+    assert profile["simulated time"] == simulation.now > 0
+    assert np.isfinite(profile["wall time per simulated time"])
+    assert profile["events"] == {"arrival": 5000, "service start": 5000, "departure": 5000}
+    assert profile["samples"].shape == (5, 3)
+    assert "inf" not in format_profile(profile)
+
+
+def test_profile_does_not_change_results():
+    logs = []
+    for profile in (False, True):
+        simulation = QueueSimulation(2, "SJF", 1.0, 1.8, 3000, np.inf, seed=4, engine="simpy", profile=profile)
+        simulation.run()
+        logs.append(simulation.get_log())
+    np.testing.assert_array_equal(logs[0][0], logs[1][0])
+    np.testing.assert_array_equal(logs[0][1], logs[1][1])
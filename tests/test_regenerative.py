@@ -0,0 +1,42 @@
+'''
+Checks the regenerative (busy-cycle) estimates of `regenerative` against the
+analytic M/M/1 results.
+'''
+
+import numpy as np
+import pytest
+
+from regenerative import simulate_cycles, pool_cycles, cycle_estimates
+from erlang import mmc_metrics
+
+RHO = 0.8
+
+
+@pytest.fixture(scope="module")
+def cycles():
+    # four segments of 20000 customers, as `main.py --regenerative -n 4`
+    return pool_cycles([simulate_cycles(seed, 1, "FIFO", 1.0, RHO, 20000, np.inf) for seed in range(4)])
+
+
+def test_cycles_split_the_segments(cycles):
+    assert cycles["customers"].min() >= 1 and np.all(cycles["length"] > 0)
+    # every complete cycle starts with a customer who does not wait:
+    assert cycles["wait"].sum() < cycles["sojourn"].sum()
+    assert 4 * 20000 * 0.95 < cycles["customers"].sum() <= 4 * 20000
+    # on average, an M/M/1 busy cycle serves 1 / (1 - rho) customers:
+    assert cycles["customers"].mean() == pytest.approx(1 / (1 - RHO), rel=0.05)
+
+
+def test_ratio_intervals_cover_mm1(cycles):
+    metrics = mmc_metrics(RHO, 1.0, 1)
+    expected = {
+        "Average waiting time": metrics["expected waiting time"],
+        "Average sojourn time": metrics["expected waiting time"] + 1.0,
+        "Time-average number in queue": metrics["expected queue length"],
+        "Time-average number in system": metrics["expected queue length"] + RHO,
+    }
+    estimates = cycle_estimates(cycles)
+    for name, value in expected.items():
+        estimate, half_width = estimates[name]
+        assert abs(estimate - value) < half_width, name
+        assert half_width < 0.1 * value, name
@@ -0,0 +1,64 @@
+'''
+Checks that `HeapQueue` and `simpy_resources.HeapPriorityResource` serve
+equal priorities in arrival order, as the `simpy.PriorityResource` they replace.
+'''
+
+import numpy as np
+import pytest
+
+from Queue import HeapQueue, QueueSimulation
+
+simpy = pytest.importorskip("simpy")
+import simpy_resources
+
+
+def test_heap_queue_is_stable():
+    rng = np.random.default_rng(0)
+    priorities = rng.integers(0, 3, 200).tolist()
+    queue = HeapQueue()
+    for i, priority in enumerate(priorities):
+        queue.push(priority, i)
+    popped = [queue.pop() for _ in priorities]
+    assert popped == sorted(range(len(priorities)), key=lambda i: priorities[i])
+
+
+def serve_order(resource_type, priorities, arrival_times):
+    env = simpy.Environment()
+    server = resource_type(env, capacity=1)
+    served = []
+
+    def customer(i):
+        yield env.timeout(arrival_times[i])
+        with server.request(priority=priorities[i]) as request:
+            yield request
+            served.append(i)
+            yield env.timeout(1.0)
+
+    for i in range(len(priorities)):
+        env.process(customer(i))
+    env.run()
+    return served
+
+
+def test_resource_serves_ties_in_arrival_order():
+    # few distinct priorities and many customers arriving at the same time:
+    rng = np.random.default_rng(1)
+    priorities = rng.integers(0, 3, 300).tolist()
+    arrival_times = np.sort(rng.integers(0, 100, 300)).astype(float).tolist()
+    expected = serve_order(simpy.PriorityResource, priorities, arrival_times)
+    assert serve_order(simpy_resources.HeapPriorityResource, priorities, arrival_times) == expected
+
+
+@pytest.mark.parametrize("B", ["M", "D"])
+def test_sjf_matches_priority_resource(B, monkeypatch):
+    # with deterministic service, all SJF priorities are equal and customers are served FIFO
+    def run_log():
+        simulation = QueueSimulation(2, "SJF", 1.0, 1.8, 2000, np.inf, seed=4, B=B, engine="simpy")
+        simulation.run()
+        return simulation.get_log()
+
+    waiting_times, queue_lengths = run_log()
+    monkeypatch.setattr(simpy_resources, "HeapPriorityResource", simpy.PriorityResource)
+    expected_waits, expected_lengths = run_log()
+    np.testing.assert_array_equal(waiting_times, expected_waits)
+    np.testing.assert_array_equal(queue_lengths, expected_lengths)
@@ -0,0 +1,90 @@
+'''
+Checks the streaming statistics of `streaming` against NumPy on the same
+observations, and the MSER-5 truncation of a synthetic warm-up.
+'''
+
+import numpy as np
+import pytest
+
+from streaming import RunningStats, QuantileSketch, BatchMeans
+
+
+@pytest.fixture
+def waits():
+    # waiting-time like data: 30% zeros, exponential otherwise
+    rng = np.random.default_rng(1)
+    xs = rng.exponential(2.0, 10**4)
+    xs[rng.random(xs.size) < 0.3] = 0.0
+    return xs
+
+
+def test_running_stats_matches_numpy(waits):
+    one_by_one, in_chunks, merged = RunningStats(), RunningStats(), RunningStats()
+    for x in waits:
+        one_by_one.update(x)
+    for chunk in np.array_split(waits, 7):
+        in_chunks.update_array(chunk)
+        part = RunningStats()
+        part.update_array(chunk)
+        merged.merge(part)
+
+    for stats in (one_by_one, in_chunks, merged):
+        assert stats.n == waits.size
+        assert stats.mean == pytest.approx(np.mean(waits), rel=1e-12)
+        assert stats.var == pytest.approx(np.var(waits), rel=1e-9)
+        assert stats.sample_var == pytest.approx(np.var(waits, ddof=1), rel=1e-9)
+        assert (stats.min, stats.max) == (waits.min(), waits.max())
+
+
+@pytest.mark.parametrize("alpha", [0.01, 0.05])
+def test_quantile_sketch_within_relative_error(waits, alpha):
+    sketch, one_by_one = QuantileSketch(alpha), QuantileSketch(alpha)
+    sketch.update_array(waits)
+    for x in waits:
+        one_by_one.update(x)
+
+    assert sketch.buckets == one_by_one.buckets and sketch.zeros == one_by_one.zeros
+    for q in (0.1, 0.3, 0.5, 0.9, 0.95, 0.99, 1.0):
+        # the sketch returns the observation of rank q (n - 1), rounded down
+        exact = np.quantile(waits, q, method="lower")
+        assert sketch.quantile(q) == pytest.approx(exact, rel=alpha, abs=0)
+
+
+def test_quantile_sketch_collapse_keeps_upper_quantiles(waits):
+    sketch = QuantileSketch(0.01, max_buckets=100)
+    sketch.update_array(waits)
+    assert len(sketch.buckets) <= 100
+    for q in (0.9, 0.99):
+        assert sketch.quantile(q) == pytest.approx(np.quantile(waits, q, method="lower"), rel=0.01)
+
+
+@pytest.mark.parametrize("warm_up", [500, 1000, 2000])
+def test_mser_truncates_warm_up_ramp(warm_up):
+    # stationary noise around 0, after a linear ramp down from 10:
+    rng = np.random.default_rng(2)
+    xs = rng.normal(0.0, 1.0, 20000)
+    xs[:warm_up] += np.linspace(10.0, 0.0, warm_up)
+    batch_means = BatchMeans()
+    batch_means.update_array(xs)
+
+    mean, half_width, dropped = batch_means.confidence_interval()
+    assert 0.8 * warm_up <= dropped <= 1.25 * warm_up
+    assert abs(mean) < half_width
+    assert abs(xs.mean()) > half_width  # without truncation, the mean is biased
+
+
+def test_batch_means_confidence_interval():
+    rng = np.random.default_rng(3)
+    xs = rng.normal(1.0, 1.0, 50000)
+    in_arrays, one_by_one = BatchMeans(max_batches=64), BatchMeans(max_batches=64)
+    for chunk in np.array_split(xs, 13):
+        in_arrays.update_array(chunk)
+    for x in xs:
+        one_by_one.update(x)
+
+    assert in_arrays.batch_size == one_by_one.batch_size
+    np.testing.assert_allclose(in_arrays.means, one_by_one.means, rtol=1e-12)
+    mean, half_width, dropped = in_arrays.confidence_interval(n_batches=20)
+    assert abs(mean - 1.0) < half_width
+    # 20 batches of independent observations: about the Student-t interval of all of them
+    assert half_width == pytest.approx(2.093 * xs.std() / np.sqrt(xs.size - dropped), rel=0.5)
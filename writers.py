@@ -0,0 +1,202 @@
+'''
+Pluggable writers for raw and averaged simulation results, and a loader.
+
+'csv':     plain text, as written by earlier versions (no metadata).
+'npz':     NumPy archive with the run parameters as JSON metadata. Averages are
+           compressed; raw logs are stored uncompressed so that `load_results`
+           can memory-map them instead of reading them into memory.
+'parquet': compressed columnar table with the run parameters in the schema
+           metadata. Requires the optional `pyarrow` package.
+
+Raw data are the waiting times and queue lengths or, for a run with a
+per-customer trace, one column per field of `Queue.CUSTOMER_DTYPE`.
+'''
+
+import json
+import struct
+import zipfile
+import numpy as np
+
+from cache import code_version
+
+METADATA_KEY = "queue_simulation"
+CUSTOMER_FORMATS = ['%d', '%.17g', '%.9g', '%.9g', '%d', '%d']  # fields of `Queue.CUSTOMER_DTYPE`
+
+
+def simulation_metadata(simulation, **extra):
+    """
+    Returns the run parameters of a `QueueSimulation` as a JSON-serializable dict.
+    """
+    seed = simulation.seed
+    metadata = {
+        "n_servers": simulation.n_servers,
+        "discipline": simulation.discipline,
+        "mean_service_rate": simulation.mean_service_rate,
+        "mean_arrival_rate": simulation.mean_arrival_rate,
+        "max_customers": simulation.max_customers,
+        "max_runtime": simulation.max_runtime,
+        "seed": seed if seed is None or isinstance(seed, int) else str(seed),
+        "B": simulation.B,
+        "engine": simulation.engine,
+        "code_version": code_version(),
+    }
+    metadata.update(extra)
+    return metadata
+
+
+class CSVWriter:
+
+    '''
+    Writes results as comma separated text.
+    '''
+
+    extension = "csv"
+
+    def write_averages(self, path, avg_waiting_times, avg_queue_lengths, metadata):
+        data = np.vstack((avg_waiting_times, avg_queue_lengths)).T
+        np.savetxt(path, data, delimiter=',', header="avg_waiting_times, avg_queue_lengths")
+
+    def write_raw(self, path, waiting_times, queue_lengths, metadata):
+        queue_lengths = queue_lengths[:waiting_times.size] # splice to make equal length
+        data = np.vstack((waiting_times, queue_lengths)).T
+        np.savetxt(path, data, delimiter=',', header="waiting_times,queue_lengths")
+
+    def write_customers(self, path, customers, metadata):
+        np.savetxt(path, customers, delimiter=',', header=",".join(customers.dtype.names), fmt=CUSTOMER_FORMATS)
+
+
+class NPZWriter:
+
+    '''
+    Writes results as NumPy archives with JSON metadata.
+    '''
+
+    extension = "npz"
+
+    def write_averages(self, path, avg_waiting_times, avg_queue_lengths, metadata):
+        np.savez_compressed(
+            path, avg_waiting_times=avg_waiting_times, avg_queue_lengths=avg_queue_lengths,
+            metadata=np.array(json.dumps(metadata))
+        )
+
+    def write_raw(self, path, waiting_times, queue_lengths, metadata):
+        # Uncompressed, so the arrays can be memory-mapped on load:
+        np.savez(path, waiting_times=waiting_times, queue_lengths=queue_lengths, metadata=np.array(json.dumps(metadata)))
+
+    def write_customers(self, path, customers, metadata):
+        # One uncompressed member per field, so `load_results` returns the fields as columns:
+        np.savez(path, **{name: customers[name] for name in customers.dtype.names}, metadata=np.array(json.dumps(metadata)))
+
+
+class ParquetWriter:
+
+    '''
+    Writes results as compressed Parquet tables (requires pyarrow).
+    Columns of unequal length are padded with NaN (as floats), columns of
+    equal length keep their type.
+    '''
+
+    extension = "parquet"
+
+    def write(self, path, columns, metadata):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("The parquet format requires pyarrow: pip install pyarrow") from e
+
+        length = max(column.size for column in columns.values())
+        columns = {
+            name: np.ascontiguousarray(column) if column.size == length else np.pad(np.asarray(column, float), (0, length - column.size), constant_values=np.NaN)
+            for name, column in columns.items()
+        }
+        table = pa.table(columns).replace_schema_metadata({METADATA_KEY: json.dumps(metadata)})
+        pq.write_table(table, path, compression="zstd")
+
+    def write_averages(self, path, avg_waiting_times, avg_queue_lengths, metadata):
+        self.write(path, {"avg_waiting_times": avg_waiting_times, "avg_queue_lengths": avg_queue_lengths}, metadata)
+
+    def write_raw(self, path, waiting_times, queue_lengths, metadata):
+        self.write(path, {"waiting_times": waiting_times, "queue_lengths": queue_lengths}, metadata)
+
+    def write_customers(self, path, customers, metadata):
+        self.write(path, {name: customers[name] for name in customers.dtype.names}, metadata)
+
+
+WRITERS = {writer.extension: writer for writer in (CSVWriter, NPZWriter, ParquetWriter)}
+FORMATS = tuple(WRITERS)
+
+
+def get_writer(output_format):
+    """
+    Returns a writer for `output_format` ('csv', 'npz' or 'parquet').
+    """
+    return WRITERS[output_format]()
+
+
+def mmap_npz_member(path, info):
+    """
+    Returns a read-only memory map of an uncompressed .npy member of the archive at `path`.
+    """
+    with open(path, 'rb') as f:
+        # Skip the zip local file header (30 bytes + file name + extra field):
+        f.seek(info.header_offset)
+        name_length, extra_length = struct.unpack('<HH', f.read(30)[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape, offset=offset, order='F' if fortran_order else 'C')
+
+
+def load_results(path, mmap=False):
+    """
+    Description
+    -----------
+    Loads results written by any of the writers.
+
+    Parameters
+    ----------
+    path : `str`
+        File with extension .csv, .npz or .parquet.
+    mmap : `bool`
+        Memory-map arrays instead of reading them (uncompressed .npz only,
+        other formats are read normally).
+
+    Returns
+    -------
+    columns : `dict` of `np.ndarray`
+    metadata : `dict`
+        Run parameters, empty for csv.
+    """
+
+    if path.endswith(".csv"):
+        with open(path) as f:
+            names = [name.strip() for name in f.readline().lstrip("# ").split(",")]
+        data = np.loadtxt(path, delimiter=',', ndmin=2)
+        return {name: data[:, i] for i, name in enumerate(names)}, {}
+
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, memory_map=mmap)
+        metadata = json.loads((table.schema.metadata or {}).get(METADATA_KEY.encode(), b"{}"))
+        return {name: table.column(name).to_numpy() for name in table.column_names}, metadata
+
+    columns = {}
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            name = info.filename[:-len(".npy")]
+            if mmap and info.compress_type == zipfile.ZIP_STORED and name != "metadata":
+                columns[name] = mmap_npz_member(path, info)
+    with np.load(path) as archive:
+        for name in archive.files:
+            if name not in columns:
+                columns[name] = archive[name]
+
+    metadata = json.loads(str(columns.pop("metadata"))) if "metadata" in columns else {}
+    return columns, metadata